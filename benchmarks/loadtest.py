@@ -0,0 +1,183 @@
+"""Load-test harness for the multi-session server mode.
+
+Opens many in-process sessions of serve_session() against a connection that
+answers Flet's protocol without a browser, then drives the Calculate handler
+from concurrent threads the way Flet's handler executor does. Reports memory
+per session (growth of the process RSS, so SQLite's connection caches are
+included), sessions per GB and handler latency percentiles as JSON.
+
+    python benchmarks/loadtest.py --sessions 200 --clicks 20 --threads 16
+"""
+import argparse
+import asyncio
+import itertools
+import json
+import os
+import statistics
+import sys
+import tempfile
+import time
+import types
+from concurrent.futures import ThreadPoolExecutor
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import flet as ft
+from flet.core.connection import Connection
+from flet.core.event import Event
+from flet.core.page import Page
+
+import carbon_calculatoradv11 as app
+
+
+class LoadTestConnection(Connection):
+    """Acknowledges every command, assigns ids to added controls and keeps each session's client storage."""
+
+    def __init__(self, loop):
+        super().__init__()
+        self.loop = loop
+        self.ids = itertools.count(1)
+        self.messages = 0
+        self.pages = {}  # session id -> Page
+        self.storage = {}  # session id -> {key: JSON value}
+
+    def send_command(self, session_id, command):
+        self.messages += 1
+        if command.name == "invokeMethod":
+            self.answer(session_id, *command.values[:2], command.attrs)
+        return types.SimpleNamespace(result="", error="")
+
+    def answer(self, session_id, method_id, method, arguments):
+        """Reply to client storage calls the way the browser does, so sessions get their own user id."""
+        storage = self.storage.setdefault(session_id, {})
+        result = None
+        if method == "clientStorage:get":
+            value = storage.get(arguments["key"])
+            result = json.dumps(value) if value is not None else None
+        elif method == "clientStorage:set":
+            storage[arguments["key"]] = arguments["value"]
+        data = json.dumps({"method_id": method_id, "result": result, "error": ""})
+        asyncio.run_coroutine_threadsafe(self.pages[session_id].on_event_async(Event("page", "invoke_method_result", data)), self.loop)
+
+    def send_commands(self, session_id, commands):
+        self.messages += 1
+        results = [" ".join(f"_{next(self.ids)}" for _ in c.commands) for c in commands if c.name == "add"]
+        return types.SimpleNamespace(results=results, error="")
+
+
+def iter_controls(control):
+    yield control
+    children = getattr(control, "controls", None)
+    if isinstance(children, list):
+        for child in children:
+            yield from iter_controls(child)
+    content = getattr(control, "content", None)
+    if isinstance(content, ft.Control):
+        yield from iter_controls(content)
+
+
+def find_session_controls(page):
+    controls = [c for root in page.controls for c in iter_controls(root)]
+    calculate = next(c for c in controls if isinstance(c, ft.ElevatedButton) and c.text == app.LANGUAGES["en"]["calculate"])
+    fields = [c for c in controls if isinstance(c, ft.TextField) and c.suffix_text]
+    return calculate, fields
+
+
+def rss_bytes():
+    """Resident set size of this process, so SQLite's and other C-level allocations are counted too."""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except OSError:
+        pass
+    if resource is None:
+        raise RuntimeError("Cannot measure process memory on this platform")
+    # Peak rather than current RSS, but sessions are only opened here, so the growth is the same
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak if sys.platform == "darwin" else peak * 1024
+
+
+def percentile(values, pct):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))]
+
+
+async def run(sessions, clicks, threads):
+    loop = asyncio.get_running_loop()
+    conn = LoadTestConnection(loop)
+
+    baseline = rss_bytes()
+    pages = []
+    for i in range(sessions):
+        page = Page(conn, f"loadtest-{i}", loop=loop)
+        conn.pages[page.session_id] = page
+        await app.serve_session(page)
+        pages.append(page)
+    await asyncio.sleep(0.1)  # Let the first coalesced updates flush
+    per_session = (rss_bytes() - baseline) / sessions
+
+    def click(page):
+        calculate, fields = find_session_controls(page)
+        for field, value in zip(fields, ("900", "50", "9000", "1600", "2", "7")):
+            field.value = value
+        latencies = []
+        for _ in range(clicks):
+            start = time.perf_counter()
+            calculate.on_click(ft.ControlEvent(target=calculate.uid, name="click", data="", control=calculate, page=page))
+            latencies.append(time.perf_counter() - start)
+        return latencies
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=threads) as pool:
+        results = await asyncio.gather(*(loop.run_in_executor(pool, click, page) for page in pages))
+    elapsed = time.perf_counter() - start
+    await asyncio.sleep(0.1)
+    latencies = [lat for session in results for lat in session]
+
+    for page in pages:
+        if page.on_close:
+            page.on_close(None)
+
+    return {
+        "sessions": sessions,
+        "handler_calls": len(latencies),
+        "memory_per_session_bytes": int(per_session),
+        "sessions_per_gb": int(2 ** 30 / per_session) if per_session > 0 else None,
+        "latency_ms": {
+            "mean": statistics.mean(latencies) * 1000,
+            "p50": percentile(latencies, 50) * 1000,
+            "p95": percentile(latencies, 95) * 1000,
+            "p99": percentile(latencies, 99) * 1000,
+        },
+        "handler_calls_per_second": len(latencies) / elapsed,
+        "update_messages": conn.messages,
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Load-test the calculator's server mode")
+    parser.add_argument("--sessions", type=int, default=100)
+    parser.add_argument("--clicks", type=int, default=20, help="Calculate clicks per session")
+    parser.add_argument("--threads", type=int, default=16, help="Concurrent handler threads")
+    parser.add_argument("--output", help="Write the JSON report to this file as well")
+    args = parser.parse_args(argv)
+
+    app.logger.setLevel("WARNING")
+    app.SESSION_LIMITS.update(max_sessions=args.sessions, history_cache_kib=256, max_pending_exports=2)
+    workdir = tempfile.mkdtemp(prefix="carbon_loadtest_")
+    os.chdir(workdir)  # Keep the sessions' history databases out of the source tree
+    report = asyncio.run(run(args.sessions, args.clicks, args.threads))
+    text = json.dumps(report, indent=2)
+    print(text)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(text)
+
+
+if __name__ == "__main__":
+    main()
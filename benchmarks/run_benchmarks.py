@@ -0,0 +1,245 @@
+"""Benchmark suite for the calculation, export and history paths.
+
+Writes machine-readable JSON so runs from different versions can be compared:
+
+    python benchmarks/run_benchmarks.py --output bench.json
+    python benchmarks/run_benchmarks.py --compare bench.json --output bench_new.json
+
+Each result has a stable "name" plus "params"; --compare matches results on
+both and reports the change in seconds, exiting non-zero when any benchmark
+is slower than --threshold.
+"""
+import argparse
+import json
+import os
+import platform
+import random
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import footprint_engine
+from footprint_engine import CATEGORY_KEYS, compute_batch, compute_footprint
+from footprint_reports import render_report, write_csv_report, write_pdf_report
+from footprint_scenarios import run_sweep
+from history_columns import HistoryColumns
+from history_store import HistoryStore
+
+
+def best_of(fn, repeat):
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        times.append(time.perf_counter() - start)
+    return min(times)
+
+
+def random_rows(n):
+    if footprint_engine.numpy_module() is not None:
+        return footprint_engine.numpy_module().random.default_rng(0).random((n, len(CATEGORY_KEYS))) * 1000
+    rng = random.Random(0)
+    return [[rng.random() * 1000 for _ in CATEGORY_KEYS] for _ in range(n)]
+
+
+def bench_compute(max_rows, repeat):
+    results = []
+    n = 1
+    while n <= max_rows:
+        rows = random_rows(n)
+        # Integer region codes (FACTOR_TABLE order) when NumPy is available, names otherwise
+        if footprint_engine.numpy_module() is not None:
+            regions = footprint_engine.numpy_module().arange(n) % 3
+        else:
+            regions = [("US", "EU", "IN")[i % 3] for i in range(n)]
+        seconds = best_of(lambda: compute_batch(rows, regions, "metric"), repeat)
+        results.append({"name": "compute_batch", "params": {"rows": n, "numpy": footprint_engine.numpy_module() is not None},
+                        "seconds": seconds, "rows_per_second": n / seconds if seconds else None})
+        n *= 10
+    values = [900, 50, 9000, 1600, 2, 7]
+    calls = 100000
+    seconds = best_of(lambda: [compute_footprint(values, "US", "metric") for _ in range(calls)], repeat)
+    results.append({"name": "compute_footprint", "params": {"calls": calls}, "seconds": seconds,
+                    "calls_per_second": calls / seconds})
+    return results
+
+
+def bench_exports(count, repeat, workdir):
+    footprints, total = compute_footprint([900, 50, 9000, 1600, 2, 7])
+    results = []
+    for fmt, write in (("csv", lambda f: write_csv_report(f, footprints, total)),
+                       ("pdf", lambda f: write_pdf_report(f, "Carbon Footprint Calculator", "Total Carbon Footprint", footprints, total))):
+        try:
+            seconds = best_of(lambda: [write(os.path.join(workdir, f"report_{i}.{fmt}")) for i in range(count)], repeat)
+        except ImportError as e:
+            results.append({"name": f"export_{fmt}", "params": {"reports": count}, "skipped": str(e)})
+            continue
+        results.append({"name": f"export_{fmt}", "params": {"reports": count}, "seconds": seconds,
+                        "reports_per_second": count / seconds})
+    results.append(bench_monthly_report(2000, repeat, workdir))
+    return results
+
+
+def bench_monthly_report(entries, repeat, workdir):
+    """One multi-page monthly PDF over `entries` history entries."""
+    path = os.path.join(workdir, "bench_monthly.db")
+    store = HistoryStore(path, batch_size=1000)
+    for i in range(entries):
+        store.append({"timestamp": f"2024-05-{1 + i % 28:02d}T{i % 24:02d}:00:00.{i:06d}", "total": 100.0, "values": [1.0] * 6})
+    store.close()
+    job = {"kind": "monthly", "filename": os.path.join(workdir, "monthly.pdf"), "format": "pdf", "history": path, "period": "2024-05"}
+    try:
+        seconds = best_of(lambda: render_report(job), repeat)
+    except ImportError as e:
+        return {"name": "export_monthly_pdf", "params": {"entries": entries}, "skipped": str(e)}
+    return {"name": "export_monthly_pdf", "params": {"entries": entries}, "seconds": seconds, "entries_per_second": entries / seconds}
+
+
+def bench_history(max_entries, lookups, workdir):
+    results = []
+    store = HistoryStore(os.path.join(workdir, "bench_history.db"), batch_size=1000)
+    size, base, rng = 0, datetime(2020, 1, 1).timestamp(), random.Random(0)
+    target = 1000
+    while target <= max_entries:
+        start, inserted = time.perf_counter(), target - size
+        while size < target:
+            store.append({"timestamp": datetime.fromtimestamp(base + size * 60).isoformat(), "total": 100.0, "values": [1.0] * 6})
+            size += 1
+        store.flush()
+        insert_seconds = time.perf_counter() - start
+        keys = [datetime.fromtimestamp(base + rng.randrange(size) * 60).isoformat() for _ in range(lookups)]
+        start = time.perf_counter()
+        for key in keys:
+            store.get(key)
+        lookup_seconds = time.perf_counter() - start
+        start = time.perf_counter()
+        store.latest(20)
+        page_seconds = time.perf_counter() - start
+        results.append({"name": "history", "params": {"entries": size},
+                        "seconds": lookup_seconds / lookups, "insert_seconds_per_entry": insert_seconds / inserted,
+                        "latest_page_seconds": page_seconds})
+        target *= 10
+    store.close()
+    start = time.perf_counter()
+    HistoryStore(os.path.join(workdir, "bench_history.db")).close()
+    results.append({"name": "history_open", "params": {"entries": size}, "seconds": time.perf_counter() - start})
+    results.append(bench_history_memory(min(max_entries, 100000)))
+    return results
+
+
+def bench_history_memory(entries):
+    """Memory per entry and a full scan (sum of totals): list of dicts vs HistoryColumns."""
+    base, rng = datetime(2020, 1, 1).timestamp(), random.Random(0)
+
+    def make_entry(i):
+        return {"timestamp": datetime.fromtimestamp(base + i * 60.5).isoformat(), "total": rng.random() * 1000,
+                "values": [rng.random() * 100 for _ in CATEGORY_KEYS]}
+
+    tracemalloc.start()
+    dicts = [make_entry(i) for i in range(entries)]
+    dict_bytes = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    tracemalloc.start()
+    columns = HistoryColumns.from_entries(make_entry(i) for i in range(entries))
+    column_bytes = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    dict_scan = best_of(lambda: sum(e["total"] for e in dicts), 3)
+    np = footprint_engine.numpy_module()
+    scan = best_of((lambda: columns.to_numpy()["total"].sum()) if np is not None else (lambda: sum(columns.totals)), 3)
+    return {"name": "history_memory", "params": {"entries": entries}, "seconds": scan, "dict_scan_seconds": dict_scan,
+            "dict_bytes_per_entry": dict_bytes / entries, "column_bytes_per_entry": column_bytes / entries,
+            "memory_reduction": 1 - column_bytes / dict_bytes}
+
+
+def bench_scenarios(repeat):
+    values = [900, 50, 9000, 1600, 2, 7]
+    results = []
+    for steps in (10, 21):
+        # steps^2 * 4 * 10 * 5 * 3 variants: 60,000 and 264,600
+        sweep = {"kilometers": [i / (steps - 1) for i in range(steps)], "electricity": [i / (steps - 1) for i in range(steps)],
+                 "flights": [0, 1, 2, 3], "gas": [0.1 * i for i in range(1, 11)], "food": [0, 0.25, 0.5, 0.75, 1],
+                 "region": ["US", "EU", "IN"]}
+        variants = run_sweep(values, sweep, top=1)["variants"]
+        seconds = best_of(lambda: run_sweep(values, sweep, top=10), repeat)
+        results.append({"name": "scenario_sweep", "params": {"variants": variants, "numpy": footprint_engine.numpy_module() is not None},
+                        "seconds": seconds, "variants_per_second": variants / seconds})
+    return results
+
+
+def bench_cold_start(runs):
+    results = []
+    for module in ("footprint_engine", "carbon_calculatoradv11", "flet"):
+        times = []
+        for _ in range(runs):
+            start = time.perf_counter()
+            subprocess.run([sys.executable, "-c", f"import {module}"], cwd=ROOT, check=True, capture_output=True)
+            times.append(time.perf_counter() - start)
+        results.append({"name": "cold_start", "params": {"module": module}, "seconds": statistics.median(times)})
+    return results
+
+
+def compare(results, baseline_path, threshold):
+    with open(baseline_path) as f:
+        baseline = {(r["name"], json.dumps(r["params"], sort_keys=True)): r for r in json.load(f)["results"]}
+    regressions = 0
+    for r in results:
+        old = baseline.get((r["name"], json.dumps(r["params"], sort_keys=True)))
+        if not old or "seconds" not in r or "seconds" not in old or not old["seconds"]:
+            continue
+        change = r["seconds"] / old["seconds"] - 1
+        flag = "REGRESSION" if change > threshold else ""
+        regressions += bool(flag)
+        print(f"{r['name']:<20} {json.dumps(r['params']):<45} {old['seconds']:.6f}s -> {r['seconds']:.6f}s ({change:+.1%}) {flag}")
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the carbon footprint calculator")
+    parser.add_argument("--max-rows", type=int, default=10 ** 7, help="Largest batch size for compute_batch")
+    parser.add_argument("--max-history", type=int, default=100000, help="Largest history size")
+    parser.add_argument("--reports", type=int, default=50, help="Reports written per export benchmark")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--only", choices=["compute", "exports", "history", "scenarios", "cold_start"], action="append")
+    parser.add_argument("--output", help="Write JSON results to this file")
+    parser.add_argument("--compare", metavar="BASELINE", help="Compare against a previous JSON results file")
+    parser.add_argument("--threshold", type=float, default=0.10, help="Slowdown treated as a regression (0.10 = 10%%)")
+    args = parser.parse_args(argv)
+
+    suites = set(args.only or ["compute", "exports", "history", "scenarios", "cold_start"])
+    results = []
+    with tempfile.TemporaryDirectory(prefix="carbon_bench_") as workdir:
+        if "compute" in suites:
+            results += bench_compute(args.max_rows, args.repeat)
+        if "exports" in suites:
+            results += bench_exports(args.reports, args.repeat, workdir)
+        if "history" in suites:
+            results += bench_history(args.max_history, 1000, workdir)
+        if "scenarios" in suites:
+            results += bench_scenarios(args.repeat)
+        if "cold_start" in suites:
+            results += bench_cold_start(args.repeat)
+
+    report = {
+        "meta": {"timestamp": datetime.now().isoformat(), "python": platform.python_version(),
+                 "platform": platform.platform(), "numpy": footprint_engine.numpy_module() is not None},
+        "results": results,
+    }
+    text = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(text)
+    else:
+        print(text)
+    if args.compare:
+        sys.exit(1 if compare(results, args.compare, args.threshold) else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,16 +1,38 @@
-import flet as ft
+from __future__ import annotations
+
+import time
+_IMPORT_START = time.perf_counter()
+
 import json
 import logging
 import os
+import sys
+import argparse
+import threading
+import uuid
+from types import MappingProxyType
 from datetime import datetime
-import csv
-from fpdf import FPDF  # For PDF export
-import asyncio
+import importlib
+from history_columns import HistoryColumns
+from history_store import DEFAULT_HISTORY_PATH, HistoryStore, user_history_path
+from history_analytics import HistoryAnalytics
+from ui_updates import UpdateScheduler
+from chart_data import downsample
+from footprint_scenarios import describe as describe_scenario, parse_sweep, run_sweep
+from footprint_reports import export_pool, report_filename, write_csv_report, write_pdf_report, render_reports
+from datasets import DATASETS
+from metrics import METRICS
+from persistence import SAVE_STORE, FORMATS as SAVE_FORMATS
+from footprint_engine import REGIONAL_FACTORS, CATEGORY_KEYS, CATEGORY_LABELS, FACTOR_TABLE, UNIT_CODES, FootprintModel, FOOTPRINT_CACHE, trees_needed
 
 # Configure logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
 
+# Flet, fpdf and asyncio are imported where they are used, so the batch CLI and
+# other headless callers never pay for the GUI stack
+IMPORT_SECONDS = time.perf_counter() - _IMPORT_START
+
 # Language dictionaries (with Telugu and Tamil)
 LANGUAGES = {
     "en": {
@@ -27,6 +49,7 @@ LANGUAGES = {
         "load": "Load",
         "export_csv": "Export CSV",
         "export_pdf": "Export PDF",
+        "export_history": "Export History",
         "total": "Total Carbon Footprint",
         "about": "About",
         "theme": "Switch Theme",
@@ -48,6 +71,7 @@ LANGUAGES = {
         "load": "लोड करें",
         "export_csv": "CSV निर्यात करें",
         "export_pdf": "PDF निर्यात करें",
+        "export_history": "इतिहास निर्यात करें",
         "total": "कुल कार्बन फुटप्रिंट",
         "about": "के बारे में",
         "theme": "थीम बदलें",
@@ -69,6 +93,7 @@ LANGUAGES = {
         "load": "Cargar",
         "export_csv": "Exportar CSV",
         "export_pdf": "Exportar PDF",
+        "export_history": "Exportar Historial",
         "total": "Huella de Carbono Total",
         "about": "Acerca de",
         "theme": "Cambiar Tema",
@@ -90,6 +115,7 @@ LANGUAGES = {
         "load": "లోడ్",
         "export_csv": "CSV ఎగుమతి",
         "export_pdf": "PDF ఎగుమతి",
+        "export_history": "చరిత్ర ఎగుమతి",
         "total": "మొత్తం కార్బన్ ఫుట్‌ప్రింట్",
         "about": "గురించి",
         "theme": "థీమ్ మార్చు",
@@ -111,6 +137,7 @@ LANGUAGES = {
         "load": "ஏற்று",
         "export_csv": "CSV ஏற்றுமதி",
         "export_pdf": "PDF ஏற்றுமதி",
+        "export_history": "வரலாறு ஏற்றுமதி",
         "total": "மொத்த கார்பன் பாதச்சுவடு",
         "about": "பற்றி",
         "theme": "தீம் மாற்று",
@@ -119,19 +146,103 @@ LANGUAGES = {
         "offset": "கார்பன் ஆஃப்செட் பரிந்துரை"
     }
 }
+# Shared read-only by every session in server mode; extra locales come from the data files
+_languages = {k: MappingProxyType(v) for k, v in LANGUAGES.items()}
+LANGUAGES = MappingProxyType(_languages)
+
+def load_locales(locales):
+    """Add or replace languages from locale data files; missing strings fall back to English."""
+    for code, strings in locales.items():
+        _languages[code] = MappingProxyType({**_languages["en"], **strings})
+
+DATASETS.subscribe(lambda datasets: load_locales(datasets.locales))
+
+# Per-session resource limits; server mode tightens these
+SESSION_LIMITS = {
+    "max_sessions": None,  # Concurrent sessions accepted (None = unlimited)
+    "history_cache_kib": None,  # SQLite page cache per session (None = SQLite default)
+    "max_pending_exports": 4  # Exports a single session may have queued at once
+}
+_active_sessions = 0
+_sessions_lock = threading.Lock()
 
-# Regional emission factors
-REGIONAL_FACTORS = {
-    "US": {"electricity": 0.92, "gas": 5.3, "water": 0.00007, "kilometers": 0.245, "flights": 900, "food": 2.5},
-    "EU": {"electricity": 0.60, "gas": 4.8, "water": 0.00005, "kilometers": 0.200, "flights": 850, "food": 2.0},
-    "IN": {"electricity": 1.20, "gas": 5.5, "water": 0.00008, "kilometers": 0.280, "flights": 950, "food": 2.8}
+# RGB values of the named Material colors used by the light and dark palettes
+THEME_RGB = {
+    "white": (0xFF, 0xFF, 0xFF), "black": (0x00, 0x00, 0x00),
+    "grey100": (0xF5, 0xF5, 0xF5), "grey200": (0xEE, 0xEE, 0xEE), "grey300": (0xE0, 0xE0, 0xE0),
+    "grey400": (0xBD, 0xBD, 0xBD), "grey500": (0x9E, 0x9E, 0x9E), "grey700": (0x61, 0x61, 0x61),
+    "grey800": (0x42, 0x42, 0x42), "grey900": (0x21, 0x21, 0x21)
 }
+THEME_ANIMATION_STEPS = 10
+THEME_ANIMATION_DURATION = 0.5  # Seconds
+_theme_palettes = {}  # (from theme, to theme) -> per-step color changes, shared by all sessions
+
+def to_rgb(color):
+    value = getattr(color, "value", color)
+    if value.startswith("#"):
+        return tuple(int(value[i:i + 2], 16) for i in (1, 3, 5))
+    return THEME_RGB[value]
+
+def interpolate_color(start_color, end_color, progress):
+    """Interpolate between two colors based on progress (0 to 1)."""
+    start_rgb = to_rgb(start_color)
+    end_rgb = to_rgb(end_color)
+    r = int(start_rgb[0] + (end_rgb[0] - start_rgb[0]) * progress)
+    g = int(start_rgb[1] + (end_rgb[1] - start_rgb[1]) * progress)
+    b = int(start_rgb[2] + (end_rgb[2] - start_rgb[2]) * progress)
+    return f"#{r:02x}{g:02x}{b:02x}"
+
+def theme_palette(key, old_colors, new_colors, steps=THEME_ANIMATION_STEPS):
+    """Return the animation as a list of {color key: value} holding only what changes at each step.
+
+    Computed once per theme pair and then reused.
+    """
+    palette = _theme_palettes.get(key)
+    if palette is None:
+        palette, previous = [], {}
+        for step in range(steps + 1):
+            frame = {k: interpolate_color(old_colors[k], new_colors[k], step / steps) for k in old_colors}
+            palette.append({k: v for k, v in frame.items() if previous.get(k) != v})
+            previous = frame
+        palette.append(dict(new_colors))  # Finish on the named colors
+        _theme_palettes[key] = palette
+    return palette
+
+async def session_user(page):
+    """The browser's persistent user id from client storage (a new one on the first visit)."""
+    try:
+        user = await page.client_storage.get_async("carbon_user_id")
+        if not user:
+            user = uuid.uuid4().hex
+            await page.client_storage.set_async("carbon_user_id", user)
+        return user
+    except Exception as e:
+        logger.warning(f"Client storage unavailable, keeping this session's data to itself: {str(e)}")
+        return f"session-{uuid.uuid4().hex}"
+
+async def main(page: ft.Page, per_user_history=False):
+    import asyncio
+    import flet as ft
 
-async def main(page: ft.Page):
+    setup_start = time.perf_counter()
+    DATASETS.ensure_loaded()  # Factor and locale files are read by the first session only
     # Initial setup
     current_lang = "en"
     current_region = "US"
-    history = []  # For historical data tracking
+    region_code = FACTOR_TABLE.code(current_region)
+    # Saved data is per user: an id kept in the browser's (or desktop profile's) client storage.
+    # In server mode history is per user too, so it is resolved before the history is opened.
+    user_id = await session_user(page) if per_user_history else None
+    history_path = user_history_path(user_id) if per_user_history else DEFAULT_HISTORY_PATH
+    history = HistoryStore(history_path, cache_kib=SESSION_LIMITS["history_cache_kib"])  # Persistent, timestamp-indexed history
+    HISTORY_PAGE_SIZE = 20  # History entries sent to the client per dropdown page
+    history_cursors = []  # "before" cursors of the pages preceding the visible one
+    history_before = None  # Cursor of the visible page (None = newest entries)
+    metrics = METRICS.session(page.session_id or "desktop")  # Hot-path timings; no-ops unless --metrics-port/--metrics-dump
+    if METRICS.enabled:
+        page.update = metrics.timed("page_update")(page.update)
+    ui = UpdateScheduler(page)  # Coalesces control updates into one message per frame
+    LIVE_RECALC_DELAY = 0.3  # Seconds of typing inactivity before results refresh
 
     # Dynamic color scheme based on theme
     def get_colors(theme_mode):
@@ -144,11 +255,10 @@ async def main(page: ft.Page):
             "progress_bg": ft.Colors.GREY_800 if theme_mode == ft.ThemeMode.DARK else ft.Colors.GREY_300
         }
 
-    colors = get_colors(page.theme_mode)
-
     # Page setup
-    page.title = LANGUAGES[current_lang]["title"]
     page.theme_mode = ft.ThemeMode.DARK
+    colors = get_colors(page.theme_mode)
+    page.title = LANGUAGES[current_lang]["title"]
     page.window_width = 900
     page.window_height = 700
     page.window_min_width = 600
@@ -181,7 +291,7 @@ async def main(page: ft.Page):
                 text_style=ft.TextStyle(color=colors["text"]),
                 bgcolor=colors["container_bg"]
             ),
-            ft.IconButton(ft.Icons.BRIGHTNESS_6, tooltip="Toggle Theme", on_click=lambda e: asyncio.run(toggle_theme(e))),
+            ft.IconButton(ft.Icons.BRIGHTNESS_6, tooltip="Toggle Theme", on_click=lambda e: page.run_task(toggle_theme, e)),
             ft.IconButton(ft.Icons.INFO, tooltip="About", on_click=lambda e: show_about_dialog(page))
         ])
     ], alignment=ft.MainAxisAlignment.SPACE_BETWEEN)
@@ -194,7 +304,10 @@ async def main(page: ft.Page):
                 e.control.error_text = "Enter a positive number"
             else:
                 e.control.error_text = None
-            page.update()
+                # Refresh already-shown results once the user pauses typing
+                if individual_results.visible:
+                    ui.debounce("live_recalc", LIVE_RECALC_DELAY, lambda: calculate_footprint(None, record=False))
+            ui.mark(e.control)
 
         return ft.Column([
             ft.Text(label, color=colors["label"]),
@@ -234,17 +347,38 @@ async def main(page: ft.Page):
         bgcolor=colors["container_bg"]
     )
     result_text = ft.Text("", size=18, weight=ft.FontWeight.BOLD, color=ft.Colors.TEAL_400)
-    individual_results = ft.Column(spacing=10, visible=False)
+    individual_results = ft.Column([ft.Text("", color=colors["label"]) for _ in CATEGORY_LABELS], spacing=10, visible=False)
     offset_suggestion = ft.Text("", size=16, color=ft.Colors.GREEN_400)
     progress_bar = ft.ProgressBar(width=600, value=0, color=ft.Colors.TEAL_600, bgcolor=colors["progress_bg"])
     chart_container = ft.Container(width=600, height=400, bgcolor=colors["container_bg"], border_radius=10)
+    trend_container = ft.Container(width=600, height=400, bgcolor=colors["container_bg"], border_radius=10, padding=10)
+    trend_summary = ft.Text("", color=colors["label"])
+    trend_category = ft.Dropdown(
+        width=200,
+        options=[ft.dropdown.Option("total", "Total")] + [ft.dropdown.Option(k, label) for k, label in zip(CATEGORY_KEYS, CATEGORY_LABELS)],
+        value="total",
+        label="Trend",
+        on_change=lambda e: ui.mark(*refresh_trend()),
+        text_style=ft.TextStyle(color=colors["text"]),
+        bgcolor=colors["container_bg"]
+    )
+    trend_scale = ft.Dropdown(
+        width=200,
+        options=[ft.dropdown.Option("monthly", "Monthly"), ft.dropdown.Option("entries", "Every calculation")],
+        value="monthly",
+        label="Trend Scale",
+        on_change=lambda e: ui.mark(*refresh_trend()),
+        text_style=ft.TextStyle(color=colors["text"]),
+        bgcolor=colors["container_bg"]
+    )
     chart_type_dropdown = ft.Dropdown(
         width=200,
         options=[ft.dropdown.Option("Pie", "Pie Chart"), ft.dropdown.Option("Bar", "Bar Chart")],
         value="Pie",
         label="Chart Type",
         text_style=ft.TextStyle(color=colors["text"]),
-        bgcolor=colors["container_bg"]
+        bgcolor=colors["container_bg"],
+        on_change=lambda e: switch_chart()
     )
     history_dropdown = ft.Dropdown(
         width=200,
@@ -255,43 +389,57 @@ async def main(page: ft.Page):
         bgcolor=colors["container_bg"]
     )
 
-    # Conversion factors
-    conversion_factors = {
-        "metric": REGIONAL_FACTORS[current_region],
-        "imperial": {k: v * (2.20462 if k == "food" else 1) for k, v in REGIONAL_FACTORS[current_region].items()}
-    }
+    # Footprint for the selected region and unit system, via the precompiled factor table
+    def current_footprint(values):
+        return FACTOR_TABLE.footprint(values, region_code, UNIT_CODES["imperial" if unit_switch.value else "metric"])
+
+    # Last computed footprint; recalculations only touch the categories that changed, and
+    # results for recently seen inputs/region/units come from the process-wide LRU cache
+    model = FootprintModel()
+    shown_unit_label = None
+    pie_chart = None
+    bar_chart = None
+    CHART_COLORS = [ft.Colors.TEAL_400, ft.Colors.RED_400, ft.Colors.BLUE_400, ft.Colors.YELLOW_400, ft.Colors.PURPLE_400, ft.Colors.ORANGE_400]
 
     # Calculate footprint with offset suggestion
-    def calculate_footprint(e):
+    @metrics.timed("calculate_footprint")
+    def calculate_footprint(e, record=True):
+        nonlocal shown_unit_label
         try:
             values = [float(inputs[key].controls[1].value or 0) for key in inputs]
             if any(val < 0 for val in values):
                 show_snack_bar(page, "Please enter non-negative values", ft.Colors.RED_700)
                 return
 
-            unit_system = "imperial" if unit_switch.value else "metric"
-            factors = conversion_factors[unit_system]
-            categories = ["Electricity", "Gas", "Water", "Driving", "Flights", "Food"]
-            footprints = [values[i] * factors[list(inputs.keys())[i]] for i in range(len(values))]
-            total_footprint = sum(footprints)
+            changed = model.update(values, region_code, UNIT_CODES["imperial" if unit_switch.value else "metric"])
+            footprints, total_footprint = model.footprints, model.total
 
-            trees_needed = total_footprint * 12 / 25
-            offset_suggestion.value = f"{LANGUAGES[current_lang]['offset']}: Plant {trees_needed:.1f} trees per year"
+            offset_suggestion.value = f"{LANGUAGES[current_lang]['offset']}: Plant {trees_needed(total_footprint):.1f} trees per year"
 
             unit_label = "lbs CO2/month" if unit_switch.value else "kg CO2/month"
             result_text.value = f"{LANGUAGES[current_lang]['total']}: {total_footprint:.2f} {unit_label}"
-            individual_results.controls = [
-                ft.Text(f"{cat}: {val:.2f} {unit_label}", color=colors["label"])
-                for cat, val in zip(categories, footprints)
-            ]
-            individual_results.visible = True
+            dirty = [result_text, offset_suggestion, progress_bar]
+            if unit_label != shown_unit_label or not individual_results.visible:
+                changed = range(len(CATEGORY_LABELS))
+                shown_unit_label = unit_label
+                individual_results.visible = True
+                dirty.append(individual_results)
+            for i in changed:
+                individual_results.controls[i].value = f"{CATEGORY_LABELS[i]}: {footprints[i]:.2f} {unit_label}"
+                dirty.append(individual_results.controls[i])
             progress_bar.value = min(total_footprint / (11000 if unit_switch.value else 5000), 1.0)
 
-            update_chart(footprints, categories)
-            history.append({"timestamp": datetime.now().isoformat(), "total": total_footprint, "values": values})
-            update_history_dropdown()
+            dirty += update_chart(footprints, changed)
+            if record:
+                history_entry = {"timestamp": datetime.now().isoformat(), "total": total_footprint, "values": values}
+                history.append(history_entry)
+                update_history_dropdown(history_entry)
+                dirty += [history_dropdown, history_next]
+                if entry_series is not None:
+                    entry_series.append(history_entry)
+                dirty += refresh_trend(analytics.add(history_entry))
 
-            page.update()
+            ui.mark(*dirty)
             logger.info("Calculation completed")
         except ValueError as e:
             logger.error(f"Invalid input: {str(e)}")
@@ -300,23 +448,115 @@ async def main(page: ft.Page):
             logger.error(f"Calculation error: {str(e)}")
             show_snack_bar(page, f"Error: {str(e)}", ft.Colors.RED_700)
 
-    def update_chart(footprints, categories):
-        colors_list = [ft.Colors.TEAL_400, ft.Colors.RED_400, ft.Colors.BLUE_400, ft.Colors.YELLOW_400, ft.Colors.PURPLE_400, ft.Colors.ORANGE_400]
-        if chart_type_dropdown.value == "Pie":
-            chart_container.content = ft.PieChart(
-                sections=[ft.PieChartSection(value=max(val, 0.001), title=f"{cat}\n{val:.1f}", color=color, radius=150)
-                         for val, cat, color in zip(footprints, categories, colors_list)],
-                sections_space=2,
-                center_space_radius=40
-            )
-        else:
-            chart_container.content = ft.BarChart(
-                bar_groups=[ft.BarChartGroup(x=i, bar_rods=[ft.BarChartRod(from_y=0, to_y=val, width=40, color=color)])
-                           for i, (val, color) in enumerate(zip(footprints, colors_list))],
-                bottom_axis=ft.ChartAxis(labels=[ft.ChartAxisLabel(value=i, label=ft.Text(cat, color=colors["text"])) for i, cat in enumerate(categories)]),
-                left_axis=ft.ChartAxis(labels_size=40),
+    @metrics.timed("update_chart")
+    def update_chart(footprints, changed):
+        """Update the changed sections/rods of the existing charts in place; returns the controls to refresh."""
+        nonlocal pie_chart, bar_chart
+        pie_dirty = []
+        if pie_chart is not None:
+            # Small slices move in and out of "Other", so compare every section rather than just `changed`
+            for section, (value, title) in zip(pie_chart.sections, model.chart_spec):
+                if section.value != value or section.title != title:
+                    section.value, section.title = value, title
+                    pie_dirty.append(section)
+        if bar_chart is not None:
+            for i in changed:
+                bar_chart.bar_groups[i].bar_rods[0].to_y = footprints[i]
+        chart = pie_chart if chart_type_dropdown.value == "Pie" else bar_chart
+        if chart is None:
+            # Built once per chart type, on first use
+            if chart_type_dropdown.value == "Pie":
+                chart = pie_chart = ft.PieChart(
+                    sections=[ft.PieChartSection(value=value, title=title, color=color, radius=150)
+                             for (value, title), color in zip(model.chart_spec, CHART_COLORS + [ft.Colors.GREY_500])],
+                    sections_space=2,
+                    center_space_radius=40
+                )
+            else:
+                chart = bar_chart = ft.BarChart(
+                    bar_groups=[ft.BarChartGroup(x=i, bar_rods=[ft.BarChartRod(from_y=0, to_y=val, width=40, color=color)])
+                               for i, (val, color) in enumerate(zip(footprints, CHART_COLORS))],
+                    bottom_axis=ft.ChartAxis(labels=[ft.ChartAxisLabel(value=i, label=ft.Text(cat, color=colors["text"])) for i, cat in enumerate(CATEGORY_LABELS)]),
+                    left_axis=ft.ChartAxis(labels_size=40),
+                    tooltip_bgcolor=colors["container_bg"]
+                )
+        if chart_container.content is not chart:
+            chart_container.content = chart
+            return [chart_container]
+        if chart is pie_chart:
+            return pie_dirty
+        return [bar_chart.bar_groups[i].bar_rods[0] for i in changed]
+
+    # Trend over the whole history, monthly (kept current by running aggregates) or per calculation
+    analytics = HistoryAnalytics.from_store(history)
+    TREND_MAX_POINTS = 200  # Longer series are downsampled (LTTB) before plotting
+    TREND_MAX_LABELS = 12
+    trend_chart = None
+    trend_plotted = None  # (scale, number of points, last label) of the plotted series
+    entry_series = None  # HistoryColumns of every calculation, read from history on first use
+
+    def trend_points(category):
+        """(label(i), values, moving averages) for the selected scale, oldest first."""
+        nonlocal entry_series
+        if trend_scale.value == "monthly":
+            points = analytics.trend(category)
+            return (lambda i: points[i][0]), [p[1] for p in points], [p[2] for p in points]
+        if entry_series is None:
+            entry_series = HistoryColumns.from_store(history)
+        return entry_series.date, entry_series.column(category), entry_series.moving_average(category, analytics.window)
+
+    def set_points(series, xs, ys):
+        """Move the series' existing points, adding or dropping only the difference."""
+        points = series.data_points
+        for i, (x, y) in enumerate(zip(xs, ys)):
+            if i < len(points):
+                points[i].x, points[i].y = x, y
+            else:
+                points.append(ft.LineChartDataPoint(x, y))
+        del points[len(xs):]
+
+    def refresh_trend(month=None):
+        """Redraw the trend chart, reusing its objects; when `month` is the last plotted month only its points change."""
+        nonlocal trend_chart, trend_plotted
+        category = None if trend_category.value == "total" else trend_category.value
+        label, values, averages = trend_points(category)
+        average = analytics.moving_average()
+        yoy = analytics.year_over_year()
+        trend_summary.value = f"Average of last {analytics.window} calculations: {average:.2f}"
+        if yoy and yoy["change"] is not None:
+            trend_summary.value += f"  |  {yoy['period']} vs last year: {yoy['change']:+.1%}"
+        if not values:
+            return [trend_summary]
+        plotted = (trend_scale.value, len(values), label(len(values) - 1))
+        if trend_chart is not None and month is not None and plotted == trend_plotted and len(values) <= TREND_MAX_POINTS:
+            mean_point = trend_chart.data_series[0].data_points[-1]
+            average_point = trend_chart.data_series[1].data_points[-1]
+            mean_point.y, average_point.y = values[-1], averages[-1]
+            return [mean_point, average_point, trend_summary]
+        trend_plotted = plotted
+        keep = downsample(values, TREND_MAX_POINTS)
+        step = max(1, -(-len(keep) // TREND_MAX_LABELS))
+        labels = [ft.ChartAxisLabel(value=i, label=ft.Text(label(i)[2:], size=10, color=colors["text"])) for i in keep[::-step][::-1]]  # Always label the newest point
+        created = trend_chart is None
+        if created:
+            trend_chart = ft.LineChart(
+                data_series=[
+                    ft.LineChartData(data_points=[], stroke_width=3, color=ft.Colors.TEAL_400, curved=True),
+                    ft.LineChartData(data_points=[], stroke_width=2, color=ft.Colors.AMBER_400, dash_pattern=[6, 4])
+                ],
+                bottom_axis=ft.ChartAxis(labels_size=30),
+                left_axis=ft.ChartAxis(labels_size=50),
                 tooltip_bgcolor=colors["container_bg"]
             )
+            trend_container.content = trend_chart
+        set_points(trend_chart.data_series[0], keep, [values[i] for i in keep])
+        set_points(trend_chart.data_series[1], keep, [averages[i] for i in keep])
+        trend_chart.bottom_axis.labels = labels
+        return [trend_container if created else trend_chart, trend_summary]
+
+    def switch_chart():
+        if individual_results.visible:
+            ui.mark(*update_chart(model.footprints, []))
 
     def toggle_units(e):
         units = {
@@ -326,161 +566,281 @@ async def main(page: ft.Page):
         unit_system = "imperial" if e.control.value else "metric"
         for key, input_field in inputs.items():
             input_field.controls[1].suffix_text = units[unit_system][key]
+            ui.mark(input_field.controls[1])
         calculate_footprint(None)
-        page.update()
 
     def change_language(e):
         nonlocal current_lang
         current_lang = e.control.value
         update_ui_language()
-        page.update()
+        ui.mark()
 
     def change_region(e):
-        nonlocal current_region
+        nonlocal current_region, region_code
         current_region = e.control.value
-        conversion_factors["metric"] = REGIONAL_FACTORS[current_region]
-        conversion_factors["imperial"] = {k: v * (2.20462 if k == "food" else 1) for k, v in REGIONAL_FACTORS[current_region].items()}
+        region_code = FACTOR_TABLE.code(current_region)
         calculate_footprint(None)
-        page.update()
+
+    theme_animating = False
 
     async def toggle_theme(e):
-        new_theme = ft.ThemeMode.LIGHT if page.theme_mode == ft.ThemeMode.DARK else ft.ThemeMode.DARK
-        steps = 10  # Number of animation steps
-        duration = 0.5  # Total duration in seconds
-        step_time = duration / steps
+        # Runs on the page's event loop; each step touches only the colors that changed
+        nonlocal theme_animating
+        if theme_animating:
+            return
+        theme_animating = True
+        try:
+            new_theme = ft.ThemeMode.LIGHT if page.theme_mode == ft.ThemeMode.DARK else ft.ThemeMode.DARK
+            palette = theme_palette((page.theme_mode, new_theme), get_colors(page.theme_mode), get_colors(new_theme))
+            step_time = THEME_ANIMATION_DURATION / THEME_ANIMATION_STEPS
+            for changed in palette:
+                update_theme_colors(changed)
+                page.update()
+                await asyncio.sleep(step_time)
+            page.theme_mode = new_theme
+            page.update()
+        finally:
+            theme_animating = False
 
-        old_colors = colors.copy()
-        new_colors = get_colors(new_theme)
+    def update_theme_colors(changed):
+        """Apply the palette entries in `changed` to the controls that use them, in place."""
+        colors.update(changed)
+        if "background" in changed:
+            page.bgcolor = colors["background"]
+            page.theme.color_scheme.background = colors["background"]
+        if "text" in changed:
+            header.controls[1].color = colors["text"]
+            for input_field in inputs.values():
+                input_field.controls[1].text_style.color = colors["text"]
+            for dropdown in (region_dropdown, chart_type_dropdown, history_dropdown, trend_category, trend_scale):
+                dropdown.text_style.color = colors["text"]
+            history_search.text_style.color = colors["text"]
+            scenario_spec.text_style.color = colors["text"]
+            for button in buttons.controls:
+                button.color = colors["text"]
+            for chart in (bar_chart, trend_chart, scenario_chart):
+                if chart is not None:
+                    for axis_label in chart.bottom_axis.labels:
+                        axis_label.label.color = colors["text"]
+        if "label" in changed:
+            for input_field in inputs.values():
+                input_field.controls[0].color = colors["label"]
+            for control in individual_results.controls:
+                control.color = colors["label"]
+            trend_summary.color = colors["label"]
+            scenario_summary.color = colors["label"]
+            for control in scenario_list.controls:
+                control.color = colors["label"]
+        if "hint" in changed:
+            for input_field in inputs.values():
+                input_field.controls[1].hint_style.color = colors["hint"]
+            history_search.hint_style.color = colors["hint"]
+            scenario_spec.hint_style.color = colors["hint"]
+        if "container_bg" in changed:
+            for dropdown in (region_dropdown, chart_type_dropdown, history_dropdown):
+                dropdown.bgcolor = colors["container_bg"]
+            chart_container.bgcolor = colors["container_bg"]
+            trend_container.bgcolor = colors["container_bg"]
+            trend_category.bgcolor = colors["container_bg"]
+            trend_scale.bgcolor = colors["container_bg"]
+            scenario_container.bgcolor = colors["container_bg"]
+            for chart in (bar_chart, trend_chart, scenario_chart):
+                if chart is not None:
+                    chart.tooltip_bgcolor = colors["container_bg"]
+        if "progress_bg" in changed:
+            progress_bar.bgcolor = colors["progress_bg"]
+            export_progress.bgcolor = colors["progress_bg"]
 
-        for step in range(steps + 1):
-            progress = step / steps
-            interpolated_colors = {
-                key: interpolate_color(old_colors[key], new_colors[key], progress)
-                for key in old_colors.keys()
-            }
-            page.bgcolor = interpolated_colors["background"]
-            update_theme_colors(interpolated_colors)
-            page.update()
-            await asyncio.sleep(step_time)
-
-        page.theme_mode = new_theme
-        colors.update(new_colors)
-        update_theme_colors(colors)
-        page.update()
-
-    def interpolate_color(start_color, end_color, progress):
-        """Interpolate between two colors based on progress (0 to 1)."""
-        start_rgb = ft.colors.to_rgb(start_color)
-        end_rgb = ft.colors.to_rgb(end_color)
-        r = int(start_rgb[0] + (end_rgb[0] - start_rgb[0]) * progress)
-        g = int(start_rgb[1] + (end_rgb[1] - start_rgb[1]) * progress)
-        b = int(start_rgb[2] + (end_rgb[2] - start_rgb[2]) * progress)
-        return f"#{r:02x}{g:02x}{b:02x}"
-
-    def update_theme_colors(temp_colors):
-        colors.update(temp_colors)
-        page.bgcolor = colors["background"]
-        header.controls[1].color = colors["text"]
-        for key, input_field in inputs.items():
-            input_field.controls[0].color = colors["label"]
-            input_field.controls[1].text_style = ft.TextStyle(color=colors["text"])
-            input_field.controls[1].hint_style = ft.TextStyle(color=colors["hint"])
-        region_dropdown.text_style = ft.TextStyle(color=colors["text"])
-        region_dropdown.bgcolor = colors["container_bg"]
-        chart_type_dropdown.text_style = ft.TextStyle(color=colors["text"])
-        chart_type_dropdown.bgcolor = colors["container_bg"]
-        history_dropdown.text_style = ft.TextStyle(color=colors["text"])
-        history_dropdown.bgcolor = colors["container_bg"]
-        progress_bar.bgcolor = colors["progress_bg"]
-        chart_container.bgcolor = colors["container_bg"]
-        individual_results.controls = [
-            ft.Text(control.value, color=colors["label"]) for control in individual_results.controls
-        ]
-        for button in buttons.controls:
-            button.color = colors["text"]
-        page.theme.color_scheme.background = colors["background"]
+    def current_user():
+        nonlocal user_id
+        if user_id is None:
+            try:
+                user_id = page.client_storage.get("carbon_user_id")
+                if not user_id:
+                    user_id = uuid.uuid4().hex
+                    page.client_storage.set("carbon_user_id", user_id)
+            except Exception as e:
+                logger.warning(f"Client storage unavailable, using the shared profile: {str(e)}")
+                user_id = "default"
+        return user_id
 
+    @metrics.timed("save_data_enqueue")  # The write itself is timed as save_write by SAVE_STORE
     def save_data(e):
         try:
             data = {key: input_field.controls[1].value for key, input_field in inputs.items()}
             data["unit_system"] = "imperial" if unit_switch.value else "metric"
             data["timestamp"] = datetime.now().isoformat()
             data["region"] = current_region
-            with open("footprint_data.json", "w") as f:
-                json.dump(data, f, indent=2)
-            show_snack_bar(page, "Data saved successfully!", ft.Colors.GREEN_700)
+
+            def done(f):
+                try:
+                    f.result()
+                    show_snack_bar(page, "Data saved successfully!", ft.Colors.GREEN_700)
+                except Exception as e:
+                    logger.error(f"Save error: {str(e)}")
+                    show_snack_bar(page, "Error saving data", ft.Colors.RED_700)
+
+            # Written atomically in the background; a burst of saves becomes one write
+            SAVE_STORE.save(current_user(), data).add_done_callback(metrics.bind(done))
         except Exception as e:
             logger.error(f"Save error: {str(e)}")
             show_snack_bar(page, "Error saving data", ft.Colors.RED_700)
 
+    def apply_saved_data(data):
+        nonlocal current_region, region_code
+        for key, input_field in inputs.items():
+            input_field.controls[1].value = data.get(key, "")
+        unit_switch.value = data.get("unit_system", "metric") == "imperial"
+        region_dropdown.value = current_region = data.get("region", "US")
+        region_code = FACTOR_TABLE.code(current_region)
+        ui.mark(region_dropdown, unit_switch, *[input_field.controls[1] for input_field in inputs.values()])
+        # Updates the unit suffixes and recalculates
+        toggle_units(ft.ControlEvent(target=unit_switch.uid, name="change", data=str(unit_switch.value).lower(), control=unit_switch, page=page))
+
     def load_data(e):
-        try:
-            with open("footprint_data.json", "r") as f:
-                data = json.load(f)
-            for key, input_field in inputs.items():
-                input_field.controls[1].value = data.get(key, "")
-            unit_switch.value = data.get("unit_system", "metric") == "imperial"
-            region_dropdown.value = data.get("region", "US")
-            change_region(ft.ControlEvent(control=region_dropdown, data=region_dropdown.value))
-            toggle_units(ft.ControlEvent(control=unit_switch, data=unit_switch.value))
-            calculate_footprint(None)
-            show_snack_bar(page, f"Data loaded from {data.get('timestamp', 'unknown time')}", ft.Colors.GREEN_700)
-        except Exception as e:
-            logger.error(f"Load error: {str(e)}")
-            show_snack_bar(page, "No saved data found", ft.Colors.RED_700)
+        def done(f):
+            try:
+                data = f.result()
+                apply_saved_data(data)
+                show_snack_bar(page, f"Data loaded from {data.get('timestamp', 'unknown time')}", ft.Colors.GREEN_700)
+            except FileNotFoundError:
+                show_snack_bar(page, "No saved data found", ft.Colors.RED_700)
+            except Exception as e:
+                logger.error(f"Load error: {str(e)}")
+                show_snack_bar(page, "Error loading data", ft.Colors.RED_700)
 
+        # Timed on the worker around the read itself. The legacy shared save file is only read in desktop mode
+        export_pool().submit(metrics.timed("load_data")(SAVE_STORE.load), current_user(), legacy=not per_user_history).add_done_callback(metrics.bind(done))
+
+    # Exports run on the shared worker pool so handlers (and other sessions) never block on file I/O
+    pending_exports = set()
+    session_closed = threading.Event()  # Stops bulk exports from starting more reports
+
+    def submit_export(metric, error_message, fn, *args):
+        """Run `fn(*args)` on the export pool, timed as `metric`; returns its Future, or None when too many exports are pending."""
+        if len(pending_exports) >= SESSION_LIMITS["max_pending_exports"]:
+            show_snack_bar(page, "Please wait for running exports to finish", ft.Colors.RED_700)
+            return None
+        future = export_pool().submit(metrics.timed(metric)(fn), *args)
+        pending_exports.add(future)
+        export_progress.value = None
+        export_progress.visible = True
+        ui.mark(export_progress)
+
+        def done(f):
+            pending_exports.discard(f)
+            export_progress.visible = bool(pending_exports)
+            ui.mark(export_progress)
+            try:
+                show_snack_bar(page, f"Exported to {f.result()}", ft.Colors.GREEN_700)
+            except Exception as e:
+                logger.error(f"Export error: {str(e)}")
+                show_snack_bar(page, error_message, ft.Colors.RED_700)
+
+        future.add_done_callback(metrics.bind(done))
+        return future
+
+    @metrics.timed("export_csv")
     def export_csv(e):
         try:
             values = [float(inputs[key].controls[1].value or 0) for key in inputs]
-            unit_system = "imperial" if unit_switch.value else "metric"
-            factors = conversion_factors[unit_system]
-            categories = ["Electricity", "Gas", "Water", "Driving", "Flights", "Food"]
-            footprints = [values[i] * factors[list(inputs.keys())[i]] for i in range(len(values))]
-            total_footprint = sum(footprints)
-
-            filename = f"carbon_footprint_{datetime.now().strftime('%Y%m%d_%H%M%S')}.csv"
-            with open(filename, "w", newline='') as f:
-                writer = csv.writer(f)
-                writer.writerow(["Category", f"CO2 ({'lbs' if unit_switch.value else 'kg'})"])
-                for cat, val in zip(categories, footprints):
-                    writer.writerow([cat, f"{val:.2f}"])
-                writer.writerow(["Total", f"{total_footprint:.2f}"])
-            show_snack_bar(page, f"Exported to {filename}", ft.Colors.GREEN_700)
+            footprints, total_footprint = current_footprint(values)
+            submit_export("export_csv_writer", "Error exporting data", write_csv_report, report_filename("csv"), footprints,
+                          total_footprint, "lbs" if unit_switch.value else "kg")
         except Exception as e:
             logger.error(f"Export error: {str(e)}")
             show_snack_bar(page, "Error exporting data", ft.Colors.RED_700)
 
+    @metrics.timed("export_pdf")
     def export_pdf(e):
         try:
             values = [float(inputs[key].controls[1].value or 0) for key in inputs]
-            unit_system = "imperial" if unit_switch.value else "metric"
-            factors = conversion_factors[unit_system]
-            categories = ["Electricity", "Gas", "Water", "Driving", "Flights", "Food"]
-            footprints = [values[i] * factors[list(inputs.keys())[i]] for i in range(len(values))]
-            total_footprint = sum(footprints)
-
-            pdf = FPDF()
-            pdf.add_page()
-            pdf.set_font("Arial", size=12)
-            pdf.cell(200, 10, txt=LANGUAGES[current_lang]["title"], ln=1, align="C")
-            pdf.ln(10)
-            for cat, val in zip(categories, footprints):
-                pdf.cell(200, 10, txt=f"{cat}: {val:.2f} {'lbs' if unit_switch.value else 'kg'} CO2/month", ln=1)
-            pdf.cell(200, 10, txt=f"{LANGUAGES[current_lang]['total']}: {total_footprint:.2f} {'lbs' if unit_switch.value else 'kg'} CO2/month", ln=1)
-            filename = f"carbon_footprint_{datetime.now().strftime('%Y%m%d_%H%M%S')}.pdf"
-            pdf.output(filename)
-            show_snack_bar(page, f"Exported to {filename}", ft.Colors.GREEN_700)
+            footprints, total_footprint = current_footprint(values)
+            submit_export("export_pdf_writer", "Error exporting PDF", write_pdf_report, report_filename("pdf"),
+                          LANGUAGES[current_lang]["title"], LANGUAGES[current_lang]["total"], footprints, total_footprint,
+                          "lbs" if unit_switch.value else "kg")
         except Exception as e:
             logger.error(f"PDF export error: {str(e)}")
             show_snack_bar(page, "Error exporting PDF", ft.Colors.RED_700)
 
-    def update_history_dropdown():
-        history_dropdown.options = [ft.dropdown.Option(h["timestamp"], f"{h['timestamp']} - {h['total']:.2f}") for h in history]
-        page.update()
+    @metrics.timed("export_history")
+    def export_history(e):
+        """Render a PDF report for every history entry in parallel worker processes."""
+        total_entries = history.count()
+        if not total_entries:
+            show_snack_bar(page, "No history to export", ft.Colors.RED_700)
+            return
+        directory = f"carbon_footprint_reports_{datetime.now().strftime('%Y%m%d_%H%M%S')}"
+        unit_system = "imperial" if unit_switch.value else "metric"
+        title, total_label = LANGUAGES[current_lang]["title"], LANGUAGES[current_lang]["total"]
+        history.flush()
+
+        def progress(done):
+            export_progress.value = done / total_entries
+            ui.mark(export_progress)
+
+        def run():
+            # Read on a connection of its own: the session's is closed when the browser disconnects
+            store = HistoryStore(history.path)
+            try:
+                os.makedirs(directory, exist_ok=True)
+                jobs = (
+                    {"filename": report_filename("pdf", h["timestamp"].replace(":", "").replace(".", "_"), directory), "format": "pdf",
+                     "values": h["values"], "region": current_region, "unit_system": unit_system,
+                     "title": title, "total_label": total_label}
+                    for h in store.iter_entries()
+                )
+                render_reports(jobs, progress=progress, cancelled=session_closed.is_set)
+            finally:
+                store.close()
+            return directory
+
+        if submit_export("export_history_writer", "Error exporting history", run):
+            export_progress.value = 0
+
+    def history_option(entry):
+        return ft.dropdown.Option(entry["timestamp"], f"{entry['timestamp']} - {entry['total']:.2f}")
+
+    def show_history_page(before=None):
+        """Send only one page of history options to the client."""
+        nonlocal history_before
+        history_before = before
+        entries = history.latest(HISTORY_PAGE_SIZE + 1, before=before, prefix=history_search.value)
+        history_dropdown.options = [history_option(h) for h in entries[:HISTORY_PAGE_SIZE]]
+        history_prev.disabled = not history_cursors
+        history_next.disabled = len(entries) <= HISTORY_PAGE_SIZE
+
+    def next_history_page(e):
+        if history_dropdown.options:
+            history_cursors.append(history_before)
+            show_history_page(history_dropdown.options[-1].key)
+            ui.mark(history_dropdown, history_prev, history_next)
+
+    def previous_history_page(e):
+        if history_cursors:
+            show_history_page(history_cursors.pop())
+            ui.mark(history_dropdown, history_prev, history_next)
+
+    def search_history(e):
+        history_cursors.clear()
+        show_history_page()
+        ui.mark(history_dropdown, history_prev, history_next)
+
+    def update_history_dropdown(entry):
+        # Only the newest unfiltered (or matching) page shows a new entry; patch it in place
+        if history_before is not None or not entry["timestamp"].startswith(history_search.value or ""):
+            return
+        history_dropdown.options.insert(0, history_option(entry))
+        if len(history_dropdown.options) > HISTORY_PAGE_SIZE:
+            history_dropdown.options.pop()
+            history_next.disabled = False
 
     def load_historical_data(e):
         if e.control.value:
-            selected = next(h for h in history if h["timestamp"] == e.control.value)
+            selected = history.get(e.control.value)
+            if selected is None:
+                show_snack_bar(page, "Historical entry not found", ft.Colors.RED_700)
+                return
             for i, key in enumerate(inputs.keys()):
                 inputs[key].controls[1].value = str(selected["values"][i])
             calculate_footprint(None)
@@ -489,28 +849,28 @@ async def main(page: ft.Page):
         for input_field in inputs.values():
             input_field.controls[1].value = ""
         result_text.value = ""
-        individual_results.controls = []
         individual_results.visible = False
+        model.reset()
         offset_suggestion.value = ""
         progress_bar.value = 0
         chart_container.content = None
-        page.update()
+        ui.mark()
 
     def show_snack_bar(page, message, color):
         page.snack_bar = ft.SnackBar(ft.Text(message), bgcolor=color)
         page.snack_bar.open = True
-        page.update()
+        ui.mark()
 
     def show_about_dialog(page):
         dlg = ft.AlertDialog(
             title=ft.Text(LANGUAGES[current_lang]["about"]),
             content=ft.Text("Advanced Carbon Footprint Calculator\nVersion 2.1\nCreated with Flet", color=colors["text"]),
-            actions=[ft.TextButton("Close", on_click=lambda e: (setattr(page.dialog, 'open', False), page.update()))],
+            actions=[ft.TextButton("Close", on_click=lambda e: (setattr(page.dialog, 'open', False), ui.mark()))],
             bgcolor=colors["container_bg"]
         )
         page.dialog = dlg
         dlg.open = True
-        page.update()
+        ui.mark()
 
     def update_ui_language():
         page.title = LANGUAGES[current_lang]["title"]
@@ -524,6 +884,7 @@ async def main(page: ft.Page):
         buttons.controls[3].text = LANGUAGES[current_lang]["load"]
         buttons.controls[4].text = LANGUAGES[current_lang]["export_csv"]
         buttons.controls[5].text = LANGUAGES[current_lang]["export_pdf"]
+        buttons.controls[6].text = LANGUAGES[current_lang]["export_history"]
 
     # Buttons
     buttons = ft.Row([
@@ -532,8 +893,10 @@ async def main(page: ft.Page):
         ft.ElevatedButton(LANGUAGES[current_lang]["save"], on_click=save_data, bgcolor=ft.Colors.GREEN_700, color=colors["text"]),
         ft.ElevatedButton(LANGUAGES[current_lang]["load"], on_click=load_data, bgcolor=ft.Colors.AMBER_700, color=colors["text"]),
         ft.ElevatedButton(LANGUAGES[current_lang]["export_csv"], on_click=export_csv, bgcolor=ft.Colors.BLUE_700, color=colors["text"]),
-        ft.ElevatedButton(LANGUAGES[current_lang]["export_pdf"], on_click=export_pdf, bgcolor=ft.Colors.PURPLE_700, color=colors["text"])
-    ], alignment=ft.MainAxisAlignment.CENTER, spacing=15)
+        ft.ElevatedButton(LANGUAGES[current_lang]["export_pdf"], on_click=export_pdf, bgcolor=ft.Colors.PURPLE_700, color=colors["text"]),
+        ft.ElevatedButton(LANGUAGES[current_lang]["export_history"], on_click=export_history, bgcolor=ft.Colors.INDIGO_700, color=colors["text"])
+    ], alignment=ft.MainAxisAlignment.CENTER, spacing=15, wrap=True)
+    export_progress = ft.ProgressBar(width=600, value=None, color=ft.Colors.AMBER_600, bgcolor=colors["progress_bg"], visible=False)
 
     # Layout
     input_grid = ft.Column([
@@ -542,7 +905,71 @@ async def main(page: ft.Page):
         ft.Row([inputs["flights"], inputs["food"]], spacing=20),
     ], spacing=20)
 
-    settings_row = ft.Row([unit_switch, region_dropdown, chart_type_dropdown, history_dropdown], spacing=20)
+    history_search = ft.TextField(
+        width=140,
+        hint_text="YYYY-MM-DD",
+        label="Search",
+        on_submit=search_history,
+        text_style=ft.TextStyle(color=colors["text"]),
+        hint_style=ft.TextStyle(color=colors["hint"])
+    )
+    history_prev = ft.IconButton(ft.Icons.CHEVRON_LEFT, tooltip="Newer entries", on_click=previous_history_page)
+    history_next = ft.IconButton(ft.Icons.CHEVRON_RIGHT, tooltip="Older entries", on_click=next_history_page)
+    show_history_page()
+    refresh_trend()
+
+    settings_row = ft.Row([unit_switch, region_dropdown, chart_type_dropdown, history_dropdown, history_prev, history_next, history_search], spacing=20, wrap=True)
+
+    # What-if sweeps: every combination is computed in one batch and the best are charted
+    SCENARIO_TOP = 10
+    scenario_chart = None
+    scenario_spec = ft.TextField(
+        width=520,
+        label="What if...",
+        hint_text="kilometers=0.5:1:0.1; electricity=0.8|1; region=US|EU",
+        on_submit=lambda e: run_scenarios(e),
+        text_style=ft.TextStyle(color=colors["text"]),
+        hint_style=ft.TextStyle(color=colors["hint"])
+    )
+    scenario_container = ft.Container(width=600, height=300, bgcolor=colors["container_bg"], border_radius=10, padding=10)
+    scenario_summary = ft.Text("", color=colors["label"])
+    scenario_list = ft.Column([ft.Text("", size=12, color=colors["label"]) for _ in range(SCENARIO_TOP)], spacing=2)
+
+    @metrics.timed("run_scenarios")
+    def run_scenarios(e):
+        nonlocal scenario_chart
+        try:
+            values = [float(inputs[key].controls[1].value or 0) for key in inputs]
+            result = run_sweep(values, parse_sweep(scenario_spec.value or ""), current_region,
+                               "imperial" if unit_switch.value else "metric", top=SCENARIO_TOP)
+        except ValueError as e:
+            logger.error(f"Scenario error: {str(e)}")
+            show_snack_bar(page, f"Invalid scenario: {str(e)}", ft.Colors.RED_700)
+            return
+        top, unit = result["top"], result["unit"]
+        scenario_summary.value = (f"{result['variants']} variants evaluated; best saves {top[0]['reduction']:.2f} {unit} "
+                                  f"({top[0]['reduction_pct']:.1f}%) per month")
+        totals = [result["baseline"]] + [variant["total"] for variant in top]
+        created = scenario_chart is None
+        if created:
+            # Baseline first, then the variants in rank order; the same bars are reused by every run
+            scenario_chart = ft.BarChart(
+                bar_groups=[ft.BarChartGroup(x=i, bar_rods=[ft.BarChartRod(from_y=0, to_y=0, width=24, color=ft.Colors.GREY_500 if i == 0 else ft.Colors.TEAL_400)])
+                            for i in range(SCENARIO_TOP + 1)],
+                bottom_axis=ft.ChartAxis(labels=[ft.ChartAxisLabel(value=i, label=ft.Text("Now" if i == 0 else f"#{i}", color=colors["text"]))
+                                                 for i in range(SCENARIO_TOP + 1)]),
+                left_axis=ft.ChartAxis(labels_size=50),
+                tooltip_bgcolor=colors["container_bg"]
+            )
+            scenario_container.content = scenario_chart
+        for i, group in enumerate(scenario_chart.bar_groups):
+            rod = group.bar_rods[0]
+            rod.to_y = totals[i] if i < len(totals) else 0
+            rod.tooltip = f"{totals[i]:.1f} {unit}" if i < len(totals) else ""
+        for i, text in enumerate(scenario_list.controls):
+            text.value = (f"#{i + 1}: {describe_scenario(top[i]['changes'])} -> {top[i]['total']:.2f} {unit} "
+                          f"(-{top[i]['reduction_pct']:.1f}%)") if i < len(top) else ""
+        ui.mark(scenario_container if created else scenario_chart, scenario_summary, scenario_list)
 
     page.add(
         header,
@@ -550,19 +977,217 @@ async def main(page: ft.Page):
         settings_row,
         ft.Container(input_grid, padding=20, bgcolor=colors["container_bg"], border_radius=10),
         buttons,
+        ft.Container(export_progress, padding=10),
         ft.Container(result_text, padding=10, alignment=ft.alignment.center),
         ft.Container(offset_suggestion, padding=10, alignment=ft.alignment.center),
         ft.Container(individual_results, padding=10, bgcolor=colors["container_bg"], border_radius=10),
         ft.Container(progress_bar, padding=10),
-        ft.Container(chart_container, alignment=ft.alignment.center, padding=10)
+        ft.Row([
+            ft.Container(chart_container, padding=10),
+            ft.Column([ft.Row([trend_category, trend_scale]), trend_container, trend_summary], spacing=10)
+        ], alignment=ft.MainAxisAlignment.CENTER, vertical_alignment=ft.CrossAxisAlignment.START, wrap=True),
+        ft.Row([scenario_spec, ft.IconButton(ft.Icons.PLAY_ARROW, tooltip="Run scenarios", on_click=lambda e: run_scenarios(e))],
+               alignment=ft.MainAxisAlignment.CENTER),
+        ft.Row([
+            ft.Container(scenario_container, padding=10),
+            ft.Column([scenario_summary, scenario_list], spacing=10)
+        ], alignment=ft.MainAxisAlignment.CENTER, vertical_alignment=ft.CrossAxisAlignment.START, wrap=True)
     )
-    logger.info("Page setup complete")
+    # Factor or locale files changed on disk: offer the new choices and recalculate with the new factors
+    def on_datasets_reloaded(datasets):
+        nonlocal region_code
+        region_dropdown.options = [ft.dropdown.Option(k, k) for k in REGIONAL_FACTORS.keys()]
+        header.controls[2].controls[0].options = [ft.dropdown.Option(k, v["language"]) for k, v in LANGUAGES.items()]
+        region_code = FACTOR_TABLE.code(current_region)
+        update_ui_language()
+        if individual_results.visible:
+            calculate_footprint(None, record=False)
+        ui.mark()
+
+    DATASETS.subscribe(on_datasets_reloaded)
+
+    # A disconnect may be a network blip that the session resumes from, so only write buffered history then
+    def on_disconnect(e):
+        try:
+            history.flush()
+        except Exception as e:
+            logger.error(f"Error writing history: {str(e)}")
+
+    # The session expired: release everything it holds
+    def end_session(e):
+        session_closed.set()
+        DATASETS.unsubscribe(on_datasets_reloaded)
+        history.close()
+        metrics.close()
+        logger.info(f"Footprint cache stats: {FOOTPRINT_CACHE.stats()}")
+
+    page.on_disconnect = on_disconnect
+    page.on_close = end_session
+    logger.info(f"Page setup complete in {(time.perf_counter() - setup_start) * 1000:.0f} ms")
+
+async def serve_session(page: ft.Page):
+    """Server-mode entry point: enforces SESSION_LIMITS["max_sessions"] around main()."""
+    import flet as ft
+
+    global _active_sessions
+    with _sessions_lock:
+        accepted = SESSION_LIMITS["max_sessions"] is None or _active_sessions < SESSION_LIMITS["max_sessions"]
+        if accepted:
+            _active_sessions += 1
+    if not accepted:
+        logger.info("Session rejected: server at capacity")
+        page.add(ft.Text("The calculator is at capacity right now. Please try again shortly."))
+        return
+    try:
+        await main(page, per_user_history=True)
+    except Exception as e:
+        with _sessions_lock:
+            _active_sessions -= 1
+        logger.error(f"Session setup failed: {str(e)}")
+        raise
+    session_cleanup = page.on_close
+
+    def on_close(e):
+        global _active_sessions
+        with _sessions_lock:
+            _active_sessions -= 1
+        session_cleanup(e)
+
+    page.on_close = on_close
+
+def startup_report():
+    """Time this module's import and each deferred dependency, in milliseconds."""
+    report = {"module_import_ms": IMPORT_SECONDS * 1000}
+    for name in ("flet", "fpdf"):
+        start = time.perf_counter()
+        try:
+            importlib.import_module(name)
+            report[f"{name}_import_ms"] = (time.perf_counter() - start) * 1000
+        except ImportError:
+            report[f"{name}_import_ms"] = None
+    return report
+
+def positive_int(value):
+    """argparse type for counts that must be at least 1."""
+    number = int(value)
+    if number < 1:
+        raise argparse.ArgumentTypeError(f"must be at least 1, got {value}")
+    return number
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Advanced Carbon Footprint Calculator")
+    parser.add_argument("--batch", metavar="INPUT", help="Calculate footprints for a CSV, JSON Lines (.jsonl) or JSON array (.json) file instead of launching the app")
+    parser.add_argument("--organization", metavar="INPUT", help="Roll up many members (with an optional department column) by department, region and category")
+    parser.add_argument("--output", metavar="OUTPUT", help="Output file (.csv, .jsonl or .json; .csv, .pdf or .json with --organization); defaults to carbon_footprint_<timestamp>.csv")
+    parser.add_argument("--chunk-size", type=positive_int, default=10000, help="Rows computed per chunk")
+    parser.add_argument("--jobs", type=int, default=1, help="Worker processes used to compute chunks and render reports")
+    parser.add_argument("--reports", metavar="DIR", help="Also render one report per household into DIR, in parallel")
+    parser.add_argument("--report-format", default="pdf", choices=["pdf", "csv"], help="Format of --reports files")
+    parser.add_argument("--monthly-reports", metavar="DIR", help="Render a multi-page PDF report for every month of history into DIR")
+    parser.add_argument("--history", default=DEFAULT_HISTORY_PATH, help="History database read by --monthly-reports")
+    parser.add_argument("--region", default="US", help="Region for rows without one (built in or from the data files)")
+    parser.add_argument("--unit-system", default="metric", choices=["metric", "imperial"], help="Unit system for rows without one")
+    parser.add_argument("--web", action="store_true", help="Serve the app to browsers instead of opening a desktop window")
+    parser.add_argument("--host", default=None, help="Host to bind in --web mode")
+    parser.add_argument("--port", type=int, default=8550, help="Port to listen on in --web mode")
+    parser.add_argument("--max-sessions", type=int, default=500, help="Concurrent browser sessions accepted in --web mode")
+    parser.add_argument("--data-dir", default=None, help="Directory of factor/locale data files (default: ./data or $CARBON_DATA_DIR)")
+    parser.add_argument("--save-dir", default="saved_data", help="Directory of per-user saved data")
+    parser.add_argument("--save-format", default="json", choices=SAVE_FORMATS, help="File format of saved data (msgpack needs the msgpack package)")
+    parser.add_argument("--metrics-port", type=int, default=None, help="Serve Prometheus metrics on this port (/metrics, /metrics.json)")
+    parser.add_argument("--metrics-dump", metavar="FILE", default=None, help="Write metrics as JSON to FILE every --metrics-interval seconds")
+    parser.add_argument("--metrics-interval", type=float, default=60.0, help="Seconds between --metrics-dump writes")
+    parser.add_argument("--startup-report", action="store_true", help="Print import timings as JSON and exit")
+    return parser.parse_args(argv)
+
+def run_batch_cli(args):
+    from footprint_batch import run_batch
+    output = args.output or f"carbon_footprint_{datetime.now().strftime('%Y%m%d_%H%M%S')}.csv"
+    logger.info(f"Starting batch calculation for {args.batch}")
+    run_batch(args.batch, output, chunk_size=args.chunk_size, jobs=args.jobs,
+              default_region=args.region, default_unit_system=args.unit_system)
+    if args.reports:
+        from footprint_batch import report_jobs
+        os.makedirs(args.reports, exist_ok=True)
+        render_reports(report_jobs(args.batch, args.reports, args.report_format, args.region, args.unit_system),
+                       workers=max(args.jobs, 1))
+
+def run_organization_cli(args):
+    from footprint_org import run_rollup, write_rollup_json
+    from footprint_reports import write_rollup_csv, write_rollup_pdf
+    output = args.output or report_filename("csv")
+    unit = "lbs" if args.unit_system == "imperial" else "kg"
+    logger.info(f"Starting organization rollup for {args.organization}")
+    rows = run_rollup(args.organization, chunk_size=args.chunk_size, jobs=args.jobs,
+                      default_region=args.region, default_unit_system=args.unit_system, unit_system=args.unit_system)
+    ext = os.path.splitext(output)[1].lower()
+    if ext == ".pdf":
+        write_rollup_pdf(output, f"{LANGUAGES['en']['title']} - Organization Summary", rows, unit)
+    elif ext == ".json":
+        write_rollup_json(output, rows, unit)
+    else:
+        write_rollup_csv(output, rows, unit)
+    logger.info(f"Organization summary written to {output}")
+
+def run_monthly_reports_cli(args):
+    from footprint_reports import monthly_report_jobs
+    os.makedirs(args.monthly_reports, exist_ok=True)
+    logger.info(f"Rendering monthly reports from {args.history}")
+    render_reports(monthly_report_jobs(args.history, args.monthly_reports, LANGUAGES["en"]["title"],
+                                       args.region, args.unit_system), workers=max(args.jobs, 1))
 
 if __name__ == "__main__":
+    args = parse_args()
+    logger.info(f"Module imported in {IMPORT_SECONDS * 1000:.0f} ms")
+    if args.data_dir:
+        DATASETS.data_dir = args.data_dir
+    SAVE_STORE.directory = args.save_dir
+    SAVE_STORE.use_format(args.save_format)
+    if args.startup_report:
+        print(json.dumps(startup_report(), indent=2))
+        sys.exit(0)
+    if args.batch:
+        try:
+            DATASETS.ensure_loaded()
+            run_batch_cli(args)
+        except Exception as e:
+            logger.error(f"Batch calculation failed: {str(e)}")
+            sys.exit(1)
+        sys.exit(0)
+    if args.organization:
+        try:
+            DATASETS.ensure_loaded()
+            run_organization_cli(args)
+        except Exception as e:
+            logger.error(f"Organization rollup failed: {str(e)}")
+            sys.exit(1)
+        sys.exit(0)
+    if args.monthly_reports:
+        try:
+            DATASETS.ensure_loaded()
+            run_monthly_reports_cli(args)
+        except Exception as e:
+            logger.error(f"Monthly reports failed: {str(e)}")
+            sys.exit(1)
+        sys.exit(0)
+    import asyncio
+    import flet as ft
+    if args.metrics_port is not None or args.metrics_dump:
+        METRICS.enable()
+        if args.metrics_port is not None:
+            METRICS.serve(args.metrics_port)
+        if args.metrics_dump:
+            METRICS.dump_periodically(args.metrics_dump, args.metrics_interval)
+    DATASETS.watch()  # Hot-reload edited factor/locale files into running sessions
+    if args.web:
+        SESSION_LIMITS.update(max_sessions=args.max_sessions, history_cache_kib=256, max_pending_exports=2)
+        logger.info(f"Starting web server on port {args.port} (max {args.max_sessions} sessions)")
+        ft.app(target=serve_session, view=ft.AppView.WEB_BROWSER, host=args.host, port=args.port)
+        sys.exit(0)
     try:
         logger.info("Starting desktop application")
         ft.app(target=lambda page: asyncio.run(main(page)))
         logger.info("Application launched successfully")
     except Exception as e:
         logger.error(f"Failed to launch: {str(e)}")
-        raise
\ No newline at end of file
+        raise
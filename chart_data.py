@@ -0,0 +1,75 @@
+"""Reduce chart data to what Flet can draw smoothly.
+
+Long series are downsampled to a fixed number of points (LTTB keeps the
+visual shape of a line, min/max bucketing keeps every peak and trough), and
+pie charts fold slices too small to read into a single "Other" slice.
+"""
+
+OTHER_LABEL = "Other"
+
+
+def lttb(ys, threshold, xs=None):
+    """Largest-Triangle-Three-Buckets: indices of at most `threshold` points that keep the line's shape.
+
+    The first and last points are always kept.
+    """
+    n = len(ys)
+    if threshold >= n or threshold < 3:
+        return list(range(n))
+    xs = xs if xs is not None else range(n)
+    every = (n - 2) / (threshold - 2)
+    kept = [0]
+    a = 0
+    for i in range(threshold - 2):
+        # Average of the next bucket is the third corner of the triangle
+        next_start = int((i + 1) * every) + 1
+        next_end = min(int((i + 2) * every) + 1, n)
+        avg_x = sum(xs[j] for j in range(next_start, next_end)) / (next_end - next_start)
+        avg_y = sum(ys[j] for j in range(next_start, next_end)) / (next_end - next_start)
+        start, end = int(i * every) + 1, int((i + 1) * every) + 1
+        ax, ay = xs[a], ys[a]
+        best, best_area = start, -1.0
+        for j in range(start, end):
+            area = abs((ax - avg_x) * (ys[j] - ay) - (ax - xs[j]) * (avg_y - ay))
+            if area > best_area:
+                best, best_area = j, area
+        kept.append(best)
+        a = best
+    kept.append(n - 1)
+    return kept
+
+
+def minmax_buckets(ys, threshold):
+    """Indices of the minimum and maximum of each of threshold/2 buckets, in order."""
+    n = len(ys)
+    if threshold >= n or threshold < 2:
+        return list(range(n))
+    buckets = threshold // 2
+    kept = []
+    for b in range(buckets):
+        start, end = b * n // buckets, (b + 1) * n // buckets
+        low = min(range(start, end), key=ys.__getitem__)
+        high = max(range(start, end), key=ys.__getitem__)
+        kept.extend(sorted({low, high}))
+    return kept
+
+
+def downsample(ys, threshold, method="lttb"):
+    """Indices of the points to plot for a series of `ys`."""
+    return minmax_buckets(ys, threshold) if method == "minmax" else lttb(ys, threshold)
+
+
+def group_slices(values, min_fraction=0.03):
+    """Split pie slices into those shown and those folded into "Other".
+
+    Returns (shown indices, grouped indices). Slices under `min_fraction` of
+    the total are grouped, but only when there are at least two of them.
+    """
+    total = sum(values)
+    if total <= 0:
+        return list(range(len(values))), []
+    small = [i for i, v in enumerate(values) if v < total * min_fraction]
+    if len(small) < 2:
+        return list(range(len(values))), []
+    grouped = set(small)
+    return [i for i in range(len(values)) if i not in grouped], small
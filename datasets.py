@@ -0,0 +1,167 @@
+"""Versioned emission-factor and translation datasets loaded from data files.
+
+Layout (under DATA_DIR, default ./data or $CARBON_DATA_DIR):
+
+    factors/<name>.json   {"version": "2024.1", "regions": {"US-CAISO": {"base": "US", "electricity": 0.21}, ...}}
+    locales/<code>.json   {"language": "Français", "title": "...", ...}  (same keys as LANGUAGES["en"])
+
+Factor files are parsed once and then cached as a compact binary file (a JSON
+header with the region names followed by raw float64 factors). Later
+startups mmap the cache and use the float64 block in place: no JSON parsing
+or copying, and each region is only compiled into the factor table when it
+is first used. Files are only read when first needed, and watch() hot-reloads
+changed files into the running process, notifying subscribed sessions.
+"""
+import json
+import logging
+import mmap
+import os
+import threading
+from array import array
+
+from footprint_engine import CATEGORY_KEYS, REGIONAL_FACTORS, load_factor_views, load_regional_factors
+
+logger = logging.getLogger(__name__)
+
+DATA_DIR = os.environ.get("CARBON_DATA_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), "data"))
+CACHE_DIR_NAME = ".cache"
+
+
+def _json_files(directory):
+    if not os.path.isdir(directory):
+        return []
+    return sorted(os.path.join(directory, name) for name in os.listdir(directory) if name.endswith(".json"))
+
+
+def write_factor_cache(path, regions, factors, version=None):
+    """Write region names and their (metric) factors in the compact binary format."""
+    header = json.dumps({"version": version, "regions": regions, "categories": list(CATEGORY_KEYS)}).encode()
+    header += b" " * (-(len(header) + 1) % 8) + b"\n"  # Keep the float64 block 8-byte aligned
+    with open(path + ".tmp", "wb") as f:
+        f.write(header)
+        factors.tofile(f)
+    os.replace(path + ".tmp", path)
+
+
+def read_factor_cache(path):
+    """Return (version, region names, factors) from a binary cache file.
+
+    `factors` is a float64 memoryview over the mapped file, not a copy; the
+    mapping stays open for as long as it is referenced.
+    """
+    with open(path, "rb") as f:
+        mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    end = mm.find(b"\n")
+    header = json.loads(mm[:end])
+    if header["categories"] != list(CATEGORY_KEYS):
+        raise ValueError(f"Cache {path} has different categories")
+    factors = memoryview(mm)[end + 1:]
+    if (end + 1) % 8 or len(factors) != len(header["regions"]) * len(CATEGORY_KEYS) * 8:
+        raise ValueError(f"Cache {path} is truncated or from an older format")
+    return header.get("version"), header["regions"], factors.cast("d")
+
+
+class Datasets:
+    """Lazily loads factor and locale files and hot-reloads them when they change."""
+
+    def __init__(self, data_dir=DATA_DIR):
+        self.data_dir = data_dir
+        self.locales = {}
+        self.versions = {}  # factor file name -> "version" declared in it
+        self._mtimes = {}
+        self._loaded = False
+        self._listeners = []
+        self._lock = threading.RLock()
+        self._watcher = None
+
+    def ensure_loaded(self):
+        with self._lock:
+            if not self._loaded:
+                self._loaded = True
+                self.reload()
+
+    def reload(self):
+        """Load every factor/locale file that is new or changed since the last call; returns True if any was."""
+        with self._lock:
+            changed = False
+            for path in _json_files(os.path.join(self.data_dir, "factors")):
+                mtime = os.stat(path).st_mtime_ns
+                if self._mtimes.get(path) != mtime:
+                    self._load_factor_file(path, mtime)
+                    self._mtimes[path] = mtime
+                    changed = True
+            for path in _json_files(os.path.join(self.data_dir, "locales")):
+                mtime = os.stat(path).st_mtime_ns
+                if self._mtimes.get(path) != mtime:
+                    with open(path, encoding="utf-8") as f:
+                        self.locales[os.path.splitext(os.path.basename(path))[0]] = json.load(f)
+                    self._mtimes[path] = mtime
+                    changed = True
+        if changed:
+            for listener in list(self._listeners):
+                try:
+                    listener(self)
+                except Exception as e:
+                    logger.error(f"Dataset listener error: {str(e)}")
+        return changed
+
+    def _load_factor_file(self, path, mtime):
+        name = os.path.splitext(os.path.basename(path))[0]
+        cache_path = os.path.join(os.path.dirname(path), CACHE_DIR_NAME, f"{name}.{mtime}.bin")
+        try:
+            version, regions, factors = read_factor_cache(cache_path)
+            load_factor_views(regions, factors)
+            self.versions[name] = version
+            logger.info(f"Loaded factor set {name} from cache (version {version or 'unversioned'}, {len(regions)} regions)")
+            return
+        except (OSError, ValueError):
+            pass  # No usable cache yet; parse the JSON and write one
+        with open(path, encoding="utf-8") as f:
+            data = json.load(f)
+        load_regional_factors(data["regions"])
+        self.versions[name] = data.get("version")
+        regions = list(data["regions"])
+        factors = array("d", (REGIONAL_FACTORS[r][k] for r in regions for k in CATEGORY_KEYS))
+        try:
+            os.makedirs(os.path.dirname(cache_path), exist_ok=True)
+            write_factor_cache(cache_path, regions, factors, data.get("version"))
+            for old in os.listdir(os.path.dirname(cache_path)):
+                if old.startswith(f"{name}.") and old != os.path.basename(cache_path):
+                    os.remove(os.path.join(os.path.dirname(cache_path), old))  # Cache of an older revision
+        except OSError as e:
+            logger.error(f"Could not write factor cache for {name}: {str(e)}")
+        logger.info(f"Loaded factor set {name} (version {data.get('version', 'unversioned')}, {len(regions)} regions)")
+
+    def subscribe(self, listener):
+        """Call listener(datasets) after every reload that changed something."""
+        self._listeners.append(listener)
+
+    def unsubscribe(self, listener):
+        if listener in self._listeners:
+            self._listeners.remove(listener)
+
+    def watch(self, interval=5.0):
+        """Poll the data files every `interval` seconds in a daemon thread and hot-reload changes."""
+        if self._watcher is not None:
+            return
+        stop = threading.Event()
+
+        def run():
+            while not stop.wait(interval):
+                try:
+                    self.reload()
+                except Exception as e:
+                    logger.error(f"Dataset reload error: {str(e)}")
+
+        self._watcher = threading.Thread(target=run, name="dataset-watcher", daemon=True)
+        self._watcher.start()
+
+
+DATASETS = Datasets()
+
+
+def load_datasets(data_dir=None):
+    """Load the data files into this process; used as the initializer of worker pools."""
+    if data_dir:
+        DATASETS.data_dir = data_dir  # Spawned workers do not inherit --data-dir
+    DATASETS.ensure_loaded()
@@ -0,0 +1,171 @@
+import csv
+import io
+import json
+import logging
+import os
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from itertools import islice
+
+from datasets import DATASETS, load_datasets
+from footprint_engine import CATEGORY_KEYS, CATEGORY_LABELS, FACTOR_TABLE, compute_batch, unit_code
+from footprint_reports import report_filename
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_CHUNK_SIZE = 10000
+CSV_HEADER = ["id", "Category", "CO2", "Unit"]
+
+
+def detect_format(path):
+    """Guess "jsonl", "json" or "csv" from a file extension."""
+    ext = os.path.splitext(path)[1].lower()
+    return "jsonl" if ext in (".jsonl", ".ndjson") else "json" if ext == ".json" else "csv"
+
+
+def read_records(path, fmt=None):
+    """Yield input records (dicts) one at a time from a CSV, JSON Lines or JSON array file.
+
+    A JSON array is parsed whole, so use JSON Lines for very large inputs.
+    """
+    fmt = fmt or detect_format(path)
+    with open(path, "r", newline="", encoding="utf-8") as f:
+        if fmt == "jsonl":
+            for number, line in enumerate(f, 1):
+                if line.strip():
+                    try:
+                        record = json.loads(line)
+                    except json.JSONDecodeError as e:
+                        raise ValueError(f"{path} line {number}: invalid JSON: {str(e)}") from None
+                    if not isinstance(record, dict):
+                        raise ValueError(f"{path} line {number}: expected a JSON object")
+                    yield record
+        elif fmt == "json":
+            try:
+                records = json.load(f)
+            except json.JSONDecodeError as e:
+                raise ValueError(f"{path}: invalid JSON: {str(e)}") from None
+            if not isinstance(records, list):
+                raise ValueError(f"{path}: expected a JSON array of records")
+            for number, record in enumerate(records, 1):
+                if not isinstance(record, dict):
+                    raise ValueError(f"{path} record {number}: expected a JSON object")
+                yield record
+        else:
+            yield from csv.DictReader(f)
+
+
+def iter_chunks(records, chunk_size=DEFAULT_CHUNK_SIZE):
+    if chunk_size < 1:
+        raise ValueError(f"Chunk size must be at least 1, got {chunk_size}")
+    records = iter(records)
+    while True:
+        chunk = list(islice(records, chunk_size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def compute_chunk(chunk, start, default_region="US", default_unit_system="metric"):
+    """Compute one chunk of records and return (ids, region/unit columns, result columns)."""
+    ids = [rec.get("id") or str(start + i + 1) for i, rec in enumerate(chunk)]
+    rows = []
+    for i, rec in enumerate(chunk):
+        try:
+            rows.append([float(rec.get(k) or 0) for k in CATEGORY_KEYS])
+        except (TypeError, ValueError) as e:
+            raise ValueError(f"Record {start + i + 1} (id {ids[i]}): {str(e)}") from None
+    regions = [rec.get("region") or default_region for rec in chunk]
+    unit_systems = [rec.get("unit_system") or default_unit_system for rec in chunk]
+    try:
+        result = compute_batch(rows, regions, unit_systems)
+    except ValueError:
+        # Name the first record with an unknown region or unit system
+        for i, (region, unit_system) in enumerate(zip(regions, unit_systems)):
+            try:
+                FACTOR_TABLE.code(region)
+                unit_code(unit_system)
+            except ValueError as e:
+                raise ValueError(f"Record {start + i + 1} (id {ids[i]}): {str(e)}") from None
+        raise
+    return ids, regions, unit_systems, result
+
+
+def format_chunk(chunk, start, fmt, default_region="US", default_unit_system="metric"):
+    """Compute a chunk and render it as output text, so workers hand back one string."""
+    ids, regions, unit_systems, result = compute_chunk(chunk, start, default_region, default_unit_system)
+    if fmt in ("jsonl", "json"):
+        lines = []
+        for i, rid in enumerate(ids):
+            out = {"id": rid, "region": regions[i], "unit_system": unit_systems[i]}
+            out.update({k: round(float(result[k][i]), 2) for k in CATEGORY_KEYS})
+            out["total"] = round(float(result["total"][i]), 2)
+            lines.append(json.dumps(out))
+        # A JSON array's elements are separated by commas, also across chunks (see run_batch)
+        return "".join(line + "\n" for line in lines) if fmt == "jsonl" else "".join(",\n" + line for line in lines)
+    # Same layout as export_csv: one row per category, then the total
+    buf = io.StringIO()
+    writer = csv.writer(buf)
+    for i, rid in enumerate(ids):
+        unit = "lbs" if unit_systems[i] == "imperial" else "kg"
+        for key, label in zip(CATEGORY_KEYS, CATEGORY_LABELS):
+            writer.writerow([rid, label, f"{result[key][i]:.2f}", unit])
+        writer.writerow([rid, "Total", f"{result['total'][i]:.2f}", unit])
+    return buf.getvalue()
+
+
+def run_batch(input_path, output_path, chunk_size=DEFAULT_CHUNK_SIZE, jobs=1,
+              default_region="US", default_unit_system="metric", input_format=None, output_format=None):
+    """Stream footprints for a whole input file to output_path; returns the row count.
+
+    Only a bounded number of chunks is in memory at once, so memory stays flat
+    regardless of input size. With jobs > 1 chunks are computed in worker
+    processes while results are still written in input order.
+    """
+    if chunk_size < 1:
+        raise ValueError(f"Chunk size must be at least 1, got {chunk_size}")
+    output_format = output_format or detect_format(output_path)
+    chunks = iter_chunks(read_records(input_path, input_format), chunk_size)
+    count = 0
+    with open(output_path, "w", newline="", encoding="utf-8") as out:
+        if output_format == "csv":
+            csv.writer(out).writerow(CSV_HEADER)
+
+        def write(text):
+            # JSON array chunks start with ",\n"; the first one opens the array instead
+            if output_format == "json" and out.tell() == 0:
+                text = "[\n" + text[2:]
+            out.write(text)
+
+        if jobs <= 1:
+            for chunk in chunks:
+                write(format_chunk(chunk, count, output_format, default_region, default_unit_system))
+                count += len(chunk)
+        else:
+            with ProcessPoolExecutor(max_workers=jobs, initializer=load_datasets, initargs=(DATASETS.data_dir,)) as pool:
+                pending = deque()
+                for chunk in chunks:
+                    pending.append(pool.submit(format_chunk, chunk, count, output_format, default_region, default_unit_system))
+                    count += len(chunk)
+                    # Keep at most two chunks per worker in flight
+                    while len(pending) >= jobs * 2:
+                        write(pending.popleft().result())
+                while pending:
+                    write(pending.popleft().result())
+        if output_format == "json":
+            out.write("\n]\n" if count else "[]\n")
+    logger.info(f"Batch calculation completed: {count} rows written to {output_path}")
+    return count
+
+
+def report_jobs(input_path, directory, fmt="pdf", default_region="US", default_unit_system="metric", input_format=None):
+    """Yield one render_report job per input record, for footprint_reports.render_reports."""
+    for i, rec in enumerate(read_records(input_path, input_format)):
+        rid = str(rec.get("id") or i + 1)
+        yield {
+            "filename": report_filename(fmt, "".join(c if c.isalnum() or c in "-_" else "_" for c in rid), directory),
+            "format": fmt,
+            "values": [float(rec.get(k) or 0) for k in CATEGORY_KEYS],
+            "region": rec.get("region") or default_region,
+            "unit_system": rec.get("unit_system") or default_unit_system,
+        }
@@ -0,0 +1,416 @@
+import logging
+import threading
+from array import array
+from collections import OrderedDict, namedtuple
+from collections.abc import Mapping
+from types import MappingProxyType
+
+from chart_data import OTHER_LABEL, group_slices
+
+logger = logging.getLogger(__name__)
+
+_np = False  # NumPy is optional and only imported on first batch use
+
+
+def numpy_module():
+    """Return the NumPy module if it is installed, else None (imported lazily)."""
+    global _np
+    if _np is False:
+        try:
+            import numpy
+            _np = numpy
+        except ImportError:  # The pure-Python path is used instead
+            _np = None
+    return _np
+
+# Input categories, in the order used by the form, exports and history entries
+CATEGORY_KEYS = ("electricity", "gas", "water", "kilometers", "flights", "food")
+CATEGORY_LABELS = ("Electricity", "Gas", "Water", "Driving", "Flights", "Food")
+UNIT_SYSTEMS = ("metric", "imperial")
+LBS_PER_KG = 2.20462
+
+# Regional emission factors
+_regional_factors = {
+    "US": {"electricity": 0.92, "gas": 5.3, "water": 0.00007, "kilometers": 0.245, "flights": 900, "food": 2.5},
+    "EU": {"electricity": 0.60, "gas": 4.8, "water": 0.00005, "kilometers": 0.200, "flights": 850, "food": 2.0},
+    "IN": {"electricity": 1.20, "gas": 5.5, "water": 0.00008, "kilometers": 0.280, "flights": 950, "food": 2.8}
+}
+_regional_factors = {k: MappingProxyType(v) for k, v in _regional_factors.items()}
+# Read-only view shared by every session; only load_regional_factors() and load_factor_views() change it
+REGIONAL_FACTORS = MappingProxyType(_regional_factors)
+
+
+class FactorView(Mapping):
+    """One region's factors read straight from a shared float64 buffer (e.g. an mmapped cache file)."""
+
+    __slots__ = ("_buffer", "_start")
+
+    def __init__(self, buffer, index):
+        self._buffer = buffer
+        self._start = index * len(CATEGORY_KEYS)
+
+    def __getitem__(self, key):
+        try:
+            return self._buffer[self._start + CATEGORY_KEYS.index(key)]
+        except ValueError:
+            raise KeyError(key) from None
+
+    def __iter__(self):
+        return iter(CATEGORY_KEYS)
+
+    def __len__(self):
+        return len(CATEGORY_KEYS)
+
+
+class FactorTable:
+    """Precompiled region x unit system x category emission factors.
+
+    Factors live in one contiguous array('d') laid out as
+    [region][unit system][category], so a region/unit pair is addressed by
+    integer codes and a footprint is a single dot product over six floats.
+    Loading more regions only appends to the array; lookups stay O(1).
+    """
+
+    def __init__(self, factors=None):
+        self.regions = []
+        self.region_codes = {}
+        self.data = array("d")
+        self.version = 0
+        self._matrix = None
+        if factors:
+            self.load(factors)
+
+    def load(self, factors):
+        """Add or replace regions from a mapping of region -> {category: factor}."""
+        width = len(UNIT_SYSTEMS) * len(CATEGORY_KEYS)
+        for region, values in factors.items():
+            row = array("d")
+            for unit_system in UNIT_SYSTEMS:
+                row.extend(values[k] * (LBS_PER_KG if k == "food" and unit_system == "imperial" else 1) for k in CATEGORY_KEYS)
+            code = self.region_codes.get(region)
+            if code is None:
+                self.region_codes[region] = len(self.regions)
+                self.regions.append(region)
+                self.data.extend(row)
+            else:
+                self.data[code * width:(code + 1) * width] = row
+        self.version += 1
+        self._matrix = None
+
+    def code(self, region):
+        try:
+            return self.region_codes[region]
+        except KeyError:
+            pass
+        # Regions registered by load_factor_views() are compiled into the table on first use
+        values = _regional_factors.get(region)
+        if values is None:
+            raise ValueError(f"Unknown region: {region}")
+        with _table_lock:
+            if region not in self.region_codes:
+                self.load({region: values})
+        return self.region_codes[region]
+
+    def factors(self, region_code, unit_code=0):
+        start = (region_code * len(UNIT_SYSTEMS) + unit_code) * len(CATEGORY_KEYS)
+        return self.data[start:start + len(CATEGORY_KEYS)]
+
+    def footprint(self, values, region_code, unit_code=0):
+        """Return (per-category footprints, total) for one household."""
+        footprints = [v * f for v, f in zip(values, self.factors(region_code, unit_code))]
+        return footprints, sum(footprints)
+
+    def as_matrix(self):
+        """Return the table as a (regions, unit systems, categories) NumPy array."""
+        # Cached copy rather than a view, so the array('d') can still grow on load()
+        if self._matrix is None:
+            np = numpy_module()
+            self._matrix = np.array(self.data, dtype=np.float64).reshape(len(self.regions), len(UNIT_SYSTEMS), len(CATEGORY_KEYS))
+        return self._matrix
+
+
+_table_lock = threading.Lock()
+FACTOR_TABLE = FactorTable(REGIONAL_FACTORS)
+
+
+# A memoized result: per-category footprints, their total and the pie chart (value, title) pairs
+CachedFootprint = namedtuple("CachedFootprint", "footprints total chart_spec")
+
+
+def trees_needed(total):
+    """Trees to plant per year to offset a monthly footprint (about 25 kg CO2 per tree per year)."""
+    return total * 12 / 25
+
+
+def chart_spec(footprints):
+    """Pie chart (section value, title) pairs for a set of footprints: one per category, then "Other".
+
+    Slices too small to read are folded into "Other"; unused sections get a zero value and no title.
+    """
+    shown, grouped = group_slices(footprints)
+    spec = [(0, "")] * (len(footprints) + 1)
+    for i in shown:
+        spec[i] = (max(footprints[i], 0.001), f"{CATEGORY_LABELS[i]}\n{footprints[i]:.1f}")
+    if grouped:
+        other = sum(footprints[i] for i in grouped)
+        spec[-1] = (other, f"{OTHER_LABEL}\n{other:.1f}")
+    return tuple(spec)
+
+
+class FootprintCache:
+    """Bounded, thread-safe LRU of computed footprints shared by the whole process.
+
+    Keys are (inputs, region code, unit code, factor table version), so
+    loading new factors makes old entries unreachable; they are also dropped
+    as soon as a version change is noticed. Hit/miss/eviction counters are
+    kept for monitoring.
+    """
+
+    def __init__(self, maxsize=4096, table=None):
+        self.maxsize = maxsize
+        self.table = table or FACTOR_TABLE
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+        self._entries = OrderedDict()
+        self._version = self.table.version
+        self._lock = threading.Lock()
+
+    def key(self, values, region_code, unit_code):
+        return (tuple(values), region_code, unit_code, self.table.version)
+
+    def _check_version(self):
+        if self.table.version != self._version:
+            self._entries.clear()
+            self._version = self.table.version
+            self.invalidations += 1
+
+    def get(self, key):
+        with self._lock:
+            self._check_version()
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry
+
+    def put(self, key, entry):
+        with self._lock:
+            self._check_version()
+            if key[-1] != self._version:
+                return  # Computed against factors that have since been replaced
+            self._entries[key] = entry
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {"size": len(self._entries), "maxsize": self.maxsize, "hits": self.hits, "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0, "evictions": self.evictions,
+                "invalidations": self.invalidations}
+
+
+FOOTPRINT_CACHE = FootprintCache()
+
+
+class FootprintModel:
+    """The last computed footprint of one form, recomputing only what changed.
+
+    update() compares the new values and factor selection against the cached
+    ones and returns the indices of the categories whose footprint changed,
+    so callers can refresh just those parts of the UI. Results are memoized
+    in `cache` (the process-wide FOOTPRINT_CACHE by default), so replaying
+    inputs or flipping back to a recent region/unit skips the computation.
+    """
+
+    def __init__(self, table=None, cache=None):
+        self.table = table or FACTOR_TABLE
+        self.cache = cache if cache is not None else FOOTPRINT_CACHE
+        self.reset()
+
+    def reset(self):
+        self.values = [None] * len(CATEGORY_KEYS)
+        self.footprints = [0.0] * len(CATEGORY_KEYS)
+        self.total = 0.0
+        self.chart_spec = chart_spec(self.footprints)
+        self._selection = None
+
+    def update(self, values, region_code, unit_code=0):
+        selection = (region_code, unit_code, self.table.version)
+        key = self.cache.key(values, region_code, unit_code)
+        cached = self.cache.get(key)
+        if cached is not None:
+            changed = [i for i, fp in enumerate(cached.footprints) if fp != self.footprints[i] or self.values[i] is None]
+            self.values = list(values)
+            self.footprints = list(cached.footprints)
+            self.total = cached.total
+            self.chart_spec = cached.chart_spec
+            self._selection = selection
+            return changed
+
+        selection_changed = selection != self._selection
+        factors = self.table.factors(region_code, unit_code)
+        changed = []
+        for i, value in enumerate(values):
+            if not selection_changed and value == self.values[i]:
+                continue
+            footprint = value * factors[i]
+            if footprint != self.footprints[i] or self.values[i] is None:
+                self.footprints[i] = footprint
+                changed.append(i)
+            self.values[i] = value
+        self._selection = selection
+        if changed:
+            self.total = sum(self.footprints)
+            self.chart_spec = chart_spec(self.footprints)
+        self.cache.put(key, CachedFootprint(tuple(self.footprints), self.total, self.chart_spec))
+        return changed
+
+
+UNIT_CODES = {name: i for i, name in enumerate(UNIT_SYSTEMS)}
+
+
+def load_regional_factors(factors, base=None):
+    """Register many regional factor sets at once, e.g. per-grid-zone electricity factors.
+
+    Entries may be partial; missing categories are taken from the entry's
+    "base" key or the `base` argument (e.g. {"US-CAISO": {"electricity": 0.21}}
+    with base="US").
+    """
+    resolved = {}
+    for region, values in factors.items():
+        parent = values.get("base", base)
+        full = dict(REGIONAL_FACTORS[parent]) if parent else {}
+        full.update({k: float(values[k]) for k in CATEGORY_KEYS if k in values})
+        missing = [k for k in CATEGORY_KEYS if k not in full]
+        if missing:
+            raise ValueError(f"Region {region} is missing factors: {', '.join(missing)}")
+        resolved[region] = full
+    _regional_factors.update({k: MappingProxyType(v) for k, v in resolved.items()})
+    FACTOR_TABLE.load(resolved)
+    logger.info(f"Loaded {len(resolved)} regional factor sets")
+
+
+def load_factor_views(regions, factors):
+    """Register complete factor sets stored in `factors`, a flat float64 buffer in CATEGORY_KEYS order.
+
+    Nothing is copied: each region reads its six factors from the buffer and
+    is compiled into FACTOR_TABLE only when first used. Regions already
+    compiled (i.e. a reload) are refreshed in place.
+    """
+    views = {region: FactorView(factors, i) for i, region in enumerate(regions)}
+    _regional_factors.update(views)
+    with _table_lock:
+        compiled = {region: views[region] for region in views if region in FACTOR_TABLE.region_codes}
+        if compiled:
+            FACTOR_TABLE.load(compiled)
+    logger.info(f"Registered {len(views)} regional factor sets")
+
+
+def unit_code(unit_system):
+    try:
+        return UNIT_CODES[unit_system]
+    except KeyError:
+        raise ValueError(f"Unknown unit system: {unit_system}") from None
+
+
+def unit_factors(region, unit_system="metric"):
+    """Return the per-category factors for a region, as a tuple in CATEGORY_KEYS order."""
+    return tuple(FACTOR_TABLE.factors(FACTOR_TABLE.code(region), unit_code(unit_system)))
+
+
+def compute_footprint(values, region="US", unit_system="metric"):
+    """Compute one household's per-category footprints and total."""
+    return FACTOR_TABLE.footprint(values, FACTOR_TABLE.code(region), unit_code(unit_system))
+
+
+def _as_rows(columns):
+    # Accept either a mapping of category -> column or a sequence of rows
+    if isinstance(columns, dict):
+        return list(zip(*(columns[k] for k in CATEGORY_KEYS)))
+    return columns
+
+
+def compute_batch(columns, regions="US", unit_systems="metric"):
+    """Compute footprints for many households in one pass.
+
+    `columns` is either a mapping of category key -> column (lists, arrays or
+    NumPy arrays) or an (n, 6) array of rows in CATEGORY_KEYS order. `regions`
+    and `unit_systems` are a single value applied to every row or a column of
+    per-row values; integer FACTOR_TABLE / UNIT_CODES codes are accepted
+    in place of names. Returns a dict of category key -> column plus "total".
+    """
+    if numpy_module() is not None:
+        return _compute_batch_numpy(columns, regions, unit_systems)
+    return _compute_batch_python(columns, regions, unit_systems)
+
+
+def _compute_batch_numpy(columns, regions, unit_systems):
+    np = numpy_module()
+    if isinstance(columns, dict):
+        values = np.column_stack([np.asarray(columns[k], dtype=np.float64) for k in CATEGORY_KEYS])
+    else:
+        values = np.asarray(columns, dtype=np.float64).reshape(-1, len(CATEGORY_KEYS))
+    n = values.shape[0]
+
+    if isinstance(regions, str) and isinstance(unit_systems, str):
+        footprints = values * np.asarray(unit_factors(regions, unit_systems))
+    else:
+        # Map regions and unit systems to table codes, then gather each row's factors
+        # (codes first: looking a region up may compile it into the table)
+        region_codes = _codes(regions, n, FACTOR_TABLE.code, len(FACTOR_TABLE.regions), "region")
+        unit_codes = _codes(unit_systems, n, unit_code, len(UNIT_CODES), "unit system")
+        footprints = values * FACTOR_TABLE.as_matrix()[region_codes, unit_codes]
+
+    result = {k: footprints[:, i] for i, k in enumerate(CATEGORY_KEYS)}
+    result["total"] = footprints.sum(axis=1)
+    return result
+
+
+def _check_code(code, count, name):
+    if not 0 <= code < count:
+        raise ValueError(f"Unknown {name} code: {code}")
+    return code
+
+
+def _codes(column, n, lookup, count, name):
+    np = numpy_module()
+    column = np.asarray(column)
+    if column.dtype.kind in "iu":
+        if column.size:
+            _check_code(int(column.min()), count, name)
+            _check_code(int(column.max()), count, name)
+        return np.broadcast_to(column, (n,))
+    names, inverse = np.unique(np.broadcast_to(column.astype(str), (n,)), return_inverse=True)
+    return np.array([lookup(str(name)) for name in names], dtype=np.intp)[inverse.reshape(-1)]
+
+
+def _compute_batch_python(columns, regions, unit_systems):
+    rows = _as_rows(columns)
+    region_col = [regions] * len(rows) if isinstance(regions, (str, int)) else regions
+    unit_col = [unit_systems] * len(rows) if isinstance(unit_systems, (str, int)) else unit_systems
+    result = {k: array("d") for k in CATEGORY_KEYS}
+    result["total"] = array("d")
+    cache = {}
+    for row, region, unit_system in zip(rows, region_col, unit_col):
+        factors = cache.get((region, unit_system))
+        if factors is None:
+            factors = cache[(region, unit_system)] = FACTOR_TABLE.factors(
+                _check_code(region, len(FACTOR_TABLE.regions), "region") if isinstance(region, int) else FACTOR_TABLE.code(region),
+                _check_code(unit_system, len(UNIT_CODES), "unit system") if isinstance(unit_system, int) else unit_code(unit_system))
+        total = 0.0
+        for k, v, f in zip(CATEGORY_KEYS, row, factors):
+            fp = float(v) * f
+            result[k].append(fp)
+            total += fp
+        result["total"].append(total)
+    return result
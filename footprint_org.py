@@ -0,0 +1,117 @@
+"""Organization mode: roll up many members' footprints by department, region and category.
+
+Members are read with footprint_batch (CSV or JSON Lines, same columns as
+--batch plus an optional "department"), computed chunk by chunk with
+compute_batch, and each chunk is reduced to partial sums in a worker process.
+The partials are merged as they arrive, so memory stays flat however many
+members there are. Every level carries totals and the tree offset.
+"""
+import json
+import logging
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+from datasets import DATASETS, load_datasets
+from footprint_batch import DEFAULT_CHUNK_SIZE, compute_chunk, iter_chunks, read_records
+from footprint_engine import CATEGORY_KEYS, LBS_PER_KG, numpy_module, trees_needed
+
+logger = logging.getLogger(__name__)
+
+LEVELS = ("organization", "department", "region")
+UNASSIGNED = "Unassigned"
+
+
+def _group_sums(keys, columns):
+    """Return {key: [count, column sums...]} for rows grouped by `keys`."""
+    np = numpy_module()
+    if np is not None:
+        names, inverse = np.unique(np.asarray(keys, dtype=str), return_inverse=True)
+        inverse = inverse.reshape(-1)
+        counts = np.bincount(inverse, minlength=len(names))
+        sums = [np.bincount(inverse, weights=np.asarray(c, dtype=np.float64), minlength=len(names)) for c in columns]
+        return {str(name): [int(counts[g])] + [float(s[g]) for s in sums] for g, name in enumerate(names)}
+    groups = {}
+    for i, key in enumerate(keys):
+        group = groups.get(key)
+        if group is None:
+            group = groups[key] = [0] + [0.0] * len(columns)
+        group[0] += 1
+        for j, column in enumerate(columns):
+            group[j + 1] += column[i]
+    return groups
+
+
+def rollup_chunk(chunk, start, default_region="US", default_unit_system="metric", unit_system="metric"):
+    """Compute one chunk of members and return its partial sums keyed by (level, key).
+
+    Footprints are converted to `unit_system` (kg or lbs) before summing, so
+    members entered in different unit systems add up.
+    """
+    _, regions, unit_systems, result = compute_chunk(chunk, start, default_region, default_unit_system)
+    np = numpy_module()
+    scale = [1.0 if u == unit_system else (1 / LBS_PER_KG if u == "imperial" else LBS_PER_KG) for u in unit_systems]
+    if np is not None:
+        scale = np.asarray(scale)
+        columns = [np.asarray(result[k]) * scale for k in CATEGORY_KEYS + ("total",)]
+    else:
+        columns = [[v * s for v, s in zip(result[k], scale)] for k in CATEGORY_KEYS + ("total",)]
+    departments = [rec.get("department") or UNASSIGNED for rec in chunk]
+    partial = {}
+    for level, keys in (("organization", ["All"] * len(chunk)), ("department", departments), ("region", regions)):
+        for key, sums in _group_sums(keys, columns).items():
+            partial[(level, key)] = sums
+    return partial
+
+
+def merge_partials(into, partial):
+    for group, sums in partial.items():
+        current = into.get(group)
+        if current is None:
+            into[group] = list(sums)
+        else:
+            for i, value in enumerate(sums):
+                current[i] += value
+    return into
+
+
+def summary_rows(totals):
+    """Flatten merged sums into report rows, organization first, then each level by total (largest first)."""
+    rows = []
+    for level in LEVELS:
+        groups = sorted(((key, sums) for (lvl, key), sums in totals.items() if lvl == level), key=lambda item: -item[1][-1])
+        for key, sums in groups:
+            members, total = sums[0], sums[-1]
+            row = {"level": level, "key": key, "members": members}
+            row.update({k: v for k, v in zip(CATEGORY_KEYS, sums[1:-1])})
+            row.update({"total": total, "mean": total / members if members else 0.0, "trees_needed": trees_needed(total)})
+            rows.append(row)
+    return rows
+
+
+def run_rollup(input_path, chunk_size=DEFAULT_CHUNK_SIZE, jobs=1, default_region="US",
+               default_unit_system="metric", unit_system="metric", input_format=None):
+    """Roll up every member in `input_path`; returns summary_rows()."""
+    chunks = iter_chunks(read_records(input_path, input_format), chunk_size)
+    totals, count = {}, 0
+    if jobs <= 1:
+        for chunk in chunks:
+            merge_partials(totals, rollup_chunk(chunk, count, default_region, default_unit_system, unit_system))
+            count += len(chunk)
+    else:
+        with ProcessPoolExecutor(max_workers=jobs, initializer=load_datasets, initargs=(DATASETS.data_dir,)) as pool:
+            pending = deque()
+            for chunk in chunks:
+                pending.append(pool.submit(rollup_chunk, chunk, count, default_region, default_unit_system, unit_system))
+                count += len(chunk)
+                while len(pending) >= jobs * 2:
+                    merge_partials(totals, pending.popleft().result())
+            while pending:
+                merge_partials(totals, pending.popleft().result())
+    logger.info(f"Rolled up {count} members into {len(totals)} groups")
+    return summary_rows(totals)
+
+
+def write_rollup_json(filename, rows, unit="kg"):
+    with open(filename, "w", encoding="utf-8") as f:
+        json.dump({"unit": unit, "rows": rows}, f, indent=2)
+    return filename
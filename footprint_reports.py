@@ -0,0 +1,344 @@
+import csv
+import logging
+import multiprocessing
+import os
+from array import array
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from datetime import datetime
+
+from chart_data import downsample
+from datasets import DATASETS, load_datasets
+from footprint_engine import CATEGORY_KEYS, CATEGORY_LABELS, compute_footprint, trees_needed
+from history_store import DEFAULT_HISTORY_PATH, HistoryStore
+
+logger = logging.getLogger(__name__)
+
+EXPORT_WORKERS = 4  # Threads shared by every session for single exports
+_export_pool = None
+REPORT_WORKERS = min(os.cpu_count() or 1, 4)  # Processes shared by every session for bulk reports
+_report_pool = None
+_report_pool_size = 0
+REPORT_FONT = os.environ.get("CARBON_REPORT_FONT")  # Optional .ttf, e.g. for titles in non-Latin scripts
+_generator = None
+_history_stores = {}  # Per worker process: history path -> open HistoryStore
+
+
+def export_pool():
+    """Process-wide thread pool that runs exports off the Flet event handlers."""
+    global _export_pool
+    if _export_pool is None:
+        _export_pool = ThreadPoolExecutor(max_workers=EXPORT_WORKERS, thread_name_prefix="export")
+    return _export_pool
+
+
+def report_pool(workers=None):
+    """Process-wide pool that renders reports, created on first use with `workers` (default REPORT_WORKERS).
+
+    Workers are started with forkserver/spawn rather than fork, so they do
+    not inherit the threads, event loop and open connections of a running
+    server.
+    """
+    global _report_pool, _report_pool_size
+    if _report_pool is None:
+        method = "forkserver" if "forkserver" in multiprocessing.get_all_start_methods() else "spawn"
+        _report_pool_size = workers or REPORT_WORKERS
+        _report_pool = ProcessPoolExecutor(max_workers=_report_pool_size, mp_context=multiprocessing.get_context(method),
+                                           initializer=load_datasets, initargs=(DATASETS.data_dir,))
+    return _report_pool
+
+
+def report_filename(ext, stamp=None, directory=None):
+    filename = f"carbon_footprint_{stamp or datetime.now().strftime('%Y%m%d_%H%M%S')}.{ext}"
+    return os.path.join(directory, filename) if directory else filename
+
+
+def write_csv_report(filename, footprints, total, unit="kg"):
+    with open(filename, "w", newline='') as f:
+        writer = csv.writer(f)
+        writer.writerow(["Category", f"CO2 ({unit})"])
+        for cat, val in zip(CATEGORY_LABELS, footprints):
+            writer.writerow([cat, f"{val:.2f}"])
+        writer.writerow(["Total", f"{total:.2f}"])
+    return filename
+
+
+class ReportGenerator:
+    """Renders PDF reports from a page template that is built once per process.
+
+    The template (geometry, colors, table columns and their x positions) is
+    computed here and reused by every document, and the document class is
+    created on first use. Built-in PDF fonts need no loading; a TTF font is
+    parsed again for each document, because fpdf subsets it in place when the
+    file is written. Table rows are drawn with text() rather than the much
+    slower cell(). Monthly reports read history entries one at a time into
+    the table and then go back to the first page to draw the summary and
+    charts, so only the totals (8 bytes per entry) are held for the chart;
+    the document itself is built in memory and written by output().
+
+    Charts are drawn as vector shapes rather than embedded images, which
+    keeps files small and needs no plotting library.
+    """
+
+    PAGE_HEIGHT = 297
+    MARGIN = 10
+    BAND_HEIGHT = 18
+    ROW_HEIGHT = 5
+    CHART_WIDTH = 90
+    CHART_HEIGHT = 60
+    CHART_BARS = 60  # Longer series are downsampled
+    TABLE_TOP = 125  # First-page table start; the summary and charts go above it
+    COLUMNS = (("Time", 34),) + tuple((label, 20) for label in CATEGORY_LABELS) + (("Total", 26),)
+    ACCENT = (0, 137, 123)
+    BAR = (38, 166, 154)
+    GREY = (189, 189, 189)
+
+    def __init__(self, font_path=None):
+        self.family, self.bold, self.font_path = "helvetica", "B", None
+        if font_path:
+            if os.path.exists(font_path):
+                self.family, self.bold, self.font_path = "report", "", font_path
+            else:
+                logger.error(f"Report font not found, using Helvetica: {font_path}")
+        self.column_x = []
+        x = self.MARGIN
+        for _, width in self.COLUMNS:
+            self.column_x.append(x)
+            x += width
+        self._document_class = None
+
+    def new_document(self, title, subtitle=""):
+        if self._document_class is None:
+            from fpdf import FPDF  # Only loaded when a PDF is actually produced
+            generator = self
+
+            class ReportDocument(FPDF):
+                def header(self):
+                    generator.draw_header(self)
+
+                def footer(self):
+                    generator.draw_footer(self)
+
+            self._document_class = ReportDocument
+        pdf = self._document_class()
+        if self.font_path:
+            pdf.add_font(self.family, "", self.font_path)
+        pdf.report_title, pdf.report_subtitle, pdf.table_headings = title, subtitle, False
+        pdf.set_auto_page_break(False)  # Tables break their own pages
+        pdf.add_page()
+        return pdf
+
+    def text(self, pdf, x, y, s):
+        """Draw `s` at (x, y); without a TTF font, characters outside Latin-1 become "?"."""
+        if not self.font_path and not s.isascii():
+            s = s.encode("latin-1", "replace").decode("latin-1")  # Core fonts are Latin-1 only
+        pdf.text(x, y, s)
+
+    def draw_header(self, pdf):
+        pdf.set_fill_color(*self.ACCENT)
+        pdf.rect(0, 0, 210, self.BAND_HEIGHT, style="F")
+        pdf.set_text_color(255, 255, 255)
+        pdf.set_font(self.family, self.bold, 14)
+        self.text(pdf, self.MARGIN, 11, pdf.report_title)
+        pdf.set_font(self.family, size=9)
+        self.text(pdf, 150, 11, pdf.report_subtitle)
+        pdf.set_text_color(0, 0, 0)
+        if pdf.table_headings:
+            self.draw_table_headings(pdf, self.BAND_HEIGHT + 8)
+
+    def draw_footer(self, pdf):
+        pdf.set_font(self.family, size=8)
+        pdf.set_text_color(120, 120, 120)
+        self.text(pdf, self.MARGIN, self.PAGE_HEIGHT - 8, f"Page {pdf.page_no()}")
+        pdf.set_text_color(0, 0, 0)
+
+    def draw_table_headings(self, pdf, y):
+        pdf.set_font(self.family, self.bold, 8)
+        for (label, _), x in zip(self.COLUMNS, self.column_x):
+            self.text(pdf, x, y, label)
+        pdf.set_draw_color(*self.GREY)
+        pdf.line(self.MARGIN, y + 1.5, 200, y + 1.5)
+
+    def draw_bar_chart(self, pdf, x, y, title, values, labels=None):
+        """Vector bar chart of `values` in a CHART_WIDTH x CHART_HEIGHT box at (x, y)."""
+        pdf.set_font(self.family, self.bold, 9)
+        self.text(pdf, x, y + 3, title)
+        top, bottom = y + 8, y + self.CHART_HEIGHT - (5 if labels else 0)
+        peak = max(values, default=0) or 1
+        slot = self.CHART_WIDTH / max(len(values), 1)
+        pdf.set_fill_color(*self.BAR)
+        for i, value in enumerate(values):
+            height = (bottom - top) * max(value, 0) / peak
+            if height > 0:
+                pdf.rect(x + i * slot + slot * 0.15, bottom - height, slot * 0.7, height, style="F")
+        pdf.set_draw_color(*self.GREY)
+        pdf.line(x, bottom, x + self.CHART_WIDTH, bottom)
+        pdf.set_font(self.family, size=6)
+        self.text(pdf, x, top - 1, f"max {peak:.1f}")
+        for i, label in enumerate(labels or ()):
+            self.text(pdf, x + i * slot + 0.5, bottom + 3.5, label[:9])
+
+    def write_summary(self, filename, title, total_label, footprints, total, unit="kg"):
+        """One-page report of a single calculation: category lines, total and a chart."""
+        pdf = self.new_document(title)
+        y = self.BAND_HEIGHT + 15
+        pdf.set_font(self.family, size=12)
+        for cat, val in zip(CATEGORY_LABELS, footprints):
+            self.text(pdf, self.MARGIN, y, f"{cat}: {val:.2f} {unit} CO2/month")
+            y += 9
+        pdf.set_font(self.family, self.bold, 12)
+        self.text(pdf, self.MARGIN, y + 3, f"{total_label}: {total:.2f} {unit} CO2/month")
+        self.draw_bar_chart(pdf, 110, self.BAND_HEIGHT + 8, f"CO2 by category ({unit})", footprints, CATEGORY_LABELS)
+        pdf.output(filename)
+        return filename
+
+    def write_monthly(self, filename, title, period, entries, region="US", unit_system="metric"):
+        """Multi-page report of one month of history: summary, charts and a table of every entry."""
+        unit = "lbs" if unit_system == "imperial" else "kg"
+        pdf = self.new_document(title, f"Monthly report {period}")
+        self.draw_table_headings(pdf, self.TABLE_TOP)
+        y = self.TABLE_TOP + self.ROW_HEIGHT + 1
+        pdf.set_font(self.family, size=7)
+        totals, sums = array("d"), [0.0] * len(CATEGORY_KEYS)
+        for entry in entries:
+            if y > self.PAGE_HEIGHT - 15:
+                pdf.table_headings = True
+                pdf.add_page()
+                y = self.BAND_HEIGHT + 8 + self.ROW_HEIGHT + 1
+                pdf.set_font(self.family, size=7)
+            self.text(pdf, self.column_x[0], y, entry["timestamp"][:16].replace("T", " "))
+            for i, value in enumerate(entry["values"]):
+                self.text(pdf, self.column_x[i + 1], y, f"{value:.1f}")
+                sums[i] += value
+            self.text(pdf, self.column_x[-1], y, f"{entry['total']:.2f}")
+            totals.append(entry["total"])
+            y += self.ROW_HEIGHT
+
+        # Summary and charts go back on the first page, above the table
+        last_page, pdf.page = pdf.page, 1
+        count = len(totals)
+        mean = sum(totals) / count if count else 0.0
+        pdf.set_font(self.family, size=11)
+        lines = [f"Calculations: {count}", f"Average total: {mean:.2f} {unit} CO2/month"]
+        if count:
+            lines += [f"Lowest / highest: {min(totals):.2f} / {max(totals):.2f} {unit}",
+                      f"Offset: plant {trees_needed(mean):.1f} trees per year"]
+        y = self.BAND_HEIGHT + 10
+        for line in lines:
+            self.text(pdf, self.MARGIN, y, line)
+            y += 7
+        keep = downsample(totals, self.CHART_BARS)
+        self.draw_bar_chart(pdf, self.MARGIN, 55, f"Total per calculation ({unit})", [totals[i] for i in keep])
+        average_footprints = compute_footprint([s / count for s in sums], region, unit_system)[0] if count else [0.0] * len(CATEGORY_KEYS)
+        self.draw_bar_chart(pdf, 110, 55, f"Average by category ({unit}, {region} factors)", average_footprints, CATEGORY_LABELS)
+        pdf.page = last_page
+        pdf.output(filename)
+        return filename
+
+
+def report_generator():
+    """This process's ReportGenerator, created on first use."""
+    global _generator
+    if _generator is None:
+        _generator = ReportGenerator(REPORT_FONT)
+    return _generator
+
+
+def write_pdf_report(filename, title, total_label, footprints, total, unit="kg"):
+    return report_generator().write_summary(filename, title, total_label, footprints, total, unit)
+
+
+def history_store(path):
+    store = _history_stores.get(path)
+    if store is None:
+        store = _history_stores[path] = HistoryStore(path)
+    return store
+
+
+def monthly_report_jobs(history_path, directory, title="Carbon Footprint Calculator", region="US", unit_system="metric"):
+    """Yield one multi-page monthly report job per month in the history, for render_reports."""
+    for period, _, _, _ in history_store(history_path).monthly_aggregates():
+        yield {"kind": "monthly", "filename": os.path.join(directory, f"carbon_footprint_{period}.pdf"), "format": "pdf",
+               "history": history_path, "period": period, "title": title, "region": region, "unit_system": unit_system}
+
+
+def write_rollup_csv(filename, rows, unit="kg"):
+    """Organization summary: one row per organization/department/region group."""
+    with open(filename, "w", newline='') as f:
+        writer = csv.writer(f)
+        writer.writerow(["Level", "Group", "Members"] + [f"{cat} CO2 ({unit})" for cat in CATEGORY_LABELS] +
+                        [f"Total CO2 ({unit})", f"Mean CO2 ({unit})", "Trees Needed"])
+        for row in rows:
+            writer.writerow([row["level"], row["key"], row["members"]] + [f"{row[k]:.2f}" for k in CATEGORY_KEYS] +
+                            [f"{row['total']:.2f}", f"{row['mean']:.2f}", f"{row['trees_needed']:.1f}"])
+    return filename
+
+
+def write_rollup_pdf(filename, title, rows, unit="kg"):
+    generator = report_generator()
+    pdf = generator.new_document(title, "Organization summary")
+    y = generator.BAND_HEIGHT + 12
+    level = None
+    for row in rows:
+        lines = []
+        if row["level"] != level:
+            level = row["level"]
+            lines.append((generator.bold, 12, f"By {level}" if level != "organization" else "Organization"))
+        lines.append(("", 10, f"{row['key']}: {row['total']:.2f} {unit} CO2/month, {row['members']} members, "
+                              f"plant {row['trees_needed']:.1f} trees per year"))
+        if level == "organization":
+            lines += [("", 10, f"    {cat}: {row[key]:.2f} {unit} CO2/month") for cat, key in zip(CATEGORY_LABELS, CATEGORY_KEYS)]
+        for style, size, text in lines:
+            if y > generator.PAGE_HEIGHT - 15:
+                pdf.add_page()
+                y = generator.BAND_HEIGHT + 10
+            pdf.set_font(generator.family, style, size)
+            generator.text(pdf, generator.MARGIN, y, text)
+            y += 7
+    pdf.output(filename)
+    return filename
+
+
+def render_report(job):
+    """Compute and write one report; `job` is a dict so it pickles cheaply to workers."""
+    if job.get("kind") == "monthly":
+        entries = history_store(job.get("history", DEFAULT_HISTORY_PATH)).iter_entries(prefix=job["period"])
+        return report_generator().write_monthly(job["filename"], job.get("title", "Carbon Footprint Calculator"), job["period"],
+                                                entries, job.get("region", "US"), job.get("unit_system", "metric"))
+    footprints, total = compute_footprint(job["values"], job.get("region", "US"), job.get("unit_system", "metric"))
+    unit = "lbs" if job.get("unit_system") == "imperial" else "kg"
+    if job["format"] == "pdf":
+        return write_pdf_report(job["filename"], job.get("title", "Carbon Footprint Calculator"),
+                                job.get("total_label", "Total Carbon Footprint"), footprints, total, unit)
+    return write_csv_report(job["filename"], footprints, total, unit)
+
+
+def render_reports(jobs, workers=None, progress=None, cancelled=None):
+    """Render many reports in the shared report_pool(); returns the number written.
+
+    `jobs` may be any iterable (e.g. a generator over history or a batch
+    file); only a few jobs per worker are in flight at once. `progress` is
+    called with the running count after each report; no more jobs are
+    started once `cancelled()` returns True. `workers` only sizes the pool
+    when this is the first use.
+    """
+    pool = report_pool(workers)
+    in_flight = _report_pool_size * 4
+    done = 0
+    pending = deque()
+    for job in jobs:
+        if cancelled and cancelled():
+            break
+        pending.append(pool.submit(render_report, job))
+        while len(pending) >= in_flight:
+            pending.popleft().result()
+            done += 1
+            if progress:
+                progress(done)
+    while pending:
+        pending.popleft().result()
+        done += 1
+        if progress:
+            progress(done)
+    logger.info(f"Rendered {done} reports")
+    return done
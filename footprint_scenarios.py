@@ -0,0 +1,118 @@
+"""What-if scenarios: evaluate a grid of input changes in one batch and rank them by reduction.
+
+A sweep maps each dimension to its options: a category key to multipliers
+of the current input (e.g. {"kilometers": [1.0, 0.7]} is "drive 30% less")
+and "region" to region names. Every combination is one variant; all variants
+are computed by a single compute_batch call over integer region codes and
+only the best `top` are described, so sweeps of 10^5+ variants stay
+interactive. The unit system is not a dimension: changing units does not
+change emissions, so it only sets the unit results are reported in.
+"""
+import heapq
+import itertools
+import math
+
+from footprint_engine import CATEGORY_KEYS, FACTOR_TABLE, compute_batch, numpy_module, unit_code
+
+MAX_VARIANTS = 10 ** 6
+SETTINGS = ("region",)
+
+
+def _multiplier(text, key):
+    value = float(text)
+    if not math.isfinite(value) or value < 0:
+        raise ValueError(f"Multipliers for {key} must be finite and not negative, got {text.strip()}")
+    return value
+
+
+def parse_sweep(spec):
+    """Parse "kilometers=0.5:1:0.1; electricity=0.8|1; region=US|EU" into a sweep.
+
+    Category options are multipliers, given as start:stop:step (inclusive) or a|b|c lists.
+    """
+    sweep, n = {}, 1
+    for part in filter(None, (p.strip() for p in spec.split(";"))):
+        key, _, options = (s.strip() for s in part.partition("="))
+        if key not in CATEGORY_KEYS and key not in SETTINGS:
+            raise ValueError(f"Unknown sweep dimension: {key}")
+        if key in SETTINGS:
+            sweep[key] = [o.strip() for o in options.split("|") if o.strip()]
+        elif ":" in options:
+            start, stop, step = (_multiplier(x, key) for x in options.split(":"))
+            if step <= 0:
+                raise ValueError(f"Step must be positive for {key}")
+            count = int(round((stop - start) / step)) + 1
+            if n * count > MAX_VARIANTS:  # Checked before building the list, which could otherwise take gigabytes
+                raise ValueError(f"Sweep has over {MAX_VARIANTS} variants")
+            sweep[key] = [round(start + i * step, 10) for i in range(count)]
+        else:
+            sweep[key] = [_multiplier(o, key) for o in options.split("|")]
+        if not sweep[key]:
+            raise ValueError(f"No options given for {key}")
+        n *= len(sweep[key])
+        if n > MAX_VARIANTS:
+            raise ValueError(f"Sweep has over {MAX_VARIANTS} variants")
+    return sweep
+
+
+def run_sweep(values, sweep, region="US", unit_system="metric", top=10):
+    """Evaluate every variant of `sweep` applied to `values` and return the `top` largest reductions.
+
+    Inputs and totals are in `unit_system`. Returns a dict with
+    the baseline total, the number of variants and the ranked variants, each
+    with its changes from the baseline, total, reduction and reduction %.
+    """
+    dims = [(key, list(options)) for key, options in sweep.items()]
+    shape = [len(options) for _, options in dims]
+    n = math.prod(shape)
+    if n > MAX_VARIANTS:
+        raise ValueError(f"Sweep has {n} variants; the limit is {MAX_VARIANTS}")
+    base_region, base_unit = FACTOR_TABLE.code(region), unit_code(unit_system)
+    baseline = FACTOR_TABLE.footprint(values, base_region, base_unit)[1]
+
+    np = numpy_module()
+    if np is not None:
+        index = np.unravel_index(np.arange(n), shape) if dims else ()
+        rows = np.tile(np.asarray(values, dtype=np.float64), (n, 1))
+        regions = base_region
+        for (key, options), ix in zip(dims, index):
+            if key == "region":
+                regions = np.array([FACTOR_TABLE.code(o) for o in options], dtype=np.intp)[ix]
+            else:
+                rows[:, CATEGORY_KEYS.index(key)] *= np.asarray(options, dtype=np.float64)[ix]
+        totals = compute_batch(rows, regions, base_unit)["total"]
+        reductions = baseline - totals
+        k = min(top, n)
+        best = np.argpartition(-reductions, k - 1)[:k] if k < n else np.arange(n)
+        best = best[np.argsort(-reductions[best], kind="stable")]
+        ranked = [(int(i), float(totals[i])) for i in best]
+    else:
+        combos = list(itertools.product(*(range(s) for s in shape)))
+        rows, regions = [], []
+        for combo in combos:
+            row, row_region = list(values), base_region
+            for (key, options), j in zip(dims, combo):
+                if key == "region":
+                    row_region = FACTOR_TABLE.code(options[j])
+                else:
+                    row[CATEGORY_KEYS.index(key)] *= options[j]
+            rows.append(row)
+            regions.append(row_region)
+        totals = compute_batch(rows, regions, base_unit)["total"]
+        ranked = heapq.nlargest(top, ((i, totals[i]) for i in range(n)), key=lambda item: baseline - item[1])
+
+    variants = []
+    for i, total in ranked:
+        combo = np.unravel_index(i, shape) if np is not None else combos[i]
+        changes = {key: options[j] for (key, options), j in zip(dims, combo) if options[j] != (region if key == "region" else 1.0)}
+        variants.append({"changes": changes, "total": total, "reduction": baseline - total,
+                         "reduction_pct": (baseline - total) / baseline * 100 if baseline else 0.0})
+    return {"baseline": baseline, "variants": n, "unit": "lbs" if unit_system == "imperial" else "kg", "top": variants}
+
+
+def describe(changes):
+    """Short label for a variant's changes, e.g. "kilometers -30%, region EU"."""
+    parts = []
+    for key, value in changes.items():
+        parts.append(f"{key} {value}" if key in SETTINGS else f"{key} {value * 100 - 100:+.0f}%")
+    return ", ".join(parts) or "no change"
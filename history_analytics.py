@@ -0,0 +1,116 @@
+from collections import deque
+
+from footprint_engine import CATEGORY_KEYS
+
+
+class _Bucket:
+    """Running sums for one month or year."""
+
+    __slots__ = ("count", "total", "categories")
+
+    def __init__(self, count=0, total=0.0, categories=None):
+        self.count = count
+        self.total = total
+        self.categories = list(categories) if categories is not None else [0.0] * len(CATEGORY_KEYS)
+
+    def add(self, total, values):
+        self.count += 1
+        self.total += total
+        for i, value in enumerate(values):
+            self.categories[i] += value
+
+    def as_dict(self, period):
+        return {
+            "period": period,
+            "count": self.count,
+            "total": self.total,
+            "mean": self.total / self.count if self.count else 0.0,
+            "categories": {k: v / self.count if self.count else 0.0 for k, v in zip(CATEGORY_KEYS, self.categories)},
+        }
+
+
+class HistoryAnalytics:
+    """Monthly/yearly rollups, trends and moving averages over the history.
+
+    Aggregates are running sums per month and year, updated in O(1) by add()
+    as calculations are appended, so nothing is rescanned. Seed it once from
+    HistoryStore.monthly_aggregates() (its per-month summary table) and the
+    newest entries for the per-entry moving average.
+
+    Category sums are over the raw input values stored in history entries.
+    """
+
+    def __init__(self, window=7):
+        self.window = window
+        self.monthly = {}  # "YYYY-MM" -> _Bucket
+        self.yearly = {}  # "YYYY" -> _Bucket
+        self._recent = deque(maxlen=window)
+        self._recent_sum = 0.0
+
+    @classmethod
+    def from_store(cls, store, window=7):
+        analytics = cls(window)
+        for period, count, total, categories in store.monthly_aggregates():
+            analytics.monthly[period] = _Bucket(count, total, categories)
+            year = analytics.yearly.setdefault(period[:4], _Bucket())
+            year.count += count
+            year.total += total
+            year.categories = [a + b for a, b in zip(year.categories, categories)]
+        for entry in reversed(store.latest(window)):
+            analytics._push_recent(entry["total"])
+        return analytics
+
+    def _push_recent(self, total):
+        if len(self._recent) == self._recent.maxlen:
+            self._recent_sum -= self._recent[0]
+        self._recent.append(total)
+        self._recent_sum += total
+
+    def add(self, entry):
+        """Fold one new history entry into the running aggregates; returns its month."""
+        month = entry["timestamp"][:7]
+        self.monthly.setdefault(month, _Bucket()).add(entry["total"], entry["values"])
+        self.yearly.setdefault(month[:4], _Bucket()).add(entry["total"], entry["values"])
+        self._push_recent(entry["total"])
+        return month
+
+    def moving_average(self):
+        """Mean total of the last `window` entries."""
+        return self._recent_sum / len(self._recent) if self._recent else 0.0
+
+    def monthly_rollup(self, last=None):
+        periods = sorted(self.monthly)[-last:] if last else sorted(self.monthly)
+        return [self.monthly[p].as_dict(p) for p in periods]
+
+    def yearly_rollup(self):
+        return [self.yearly[p].as_dict(p) for p in sorted(self.yearly)]
+
+    def trend(self, category=None, last=None, months=3):
+        """Monthly mean of the total (or one category) with a `months`-month moving average.
+
+        Returns a list of (period, mean, moving average) tuples, oldest first.
+        """
+        index = CATEGORY_KEYS.index(category) if category else None
+        points, window, window_sum = [], deque(maxlen=months), 0.0
+        for period in sorted(self.monthly):
+            bucket = self.monthly[period]
+            value = (bucket.total if index is None else bucket.categories[index]) / bucket.count
+            if len(window) == months:
+                window_sum -= window[0]
+            window.append(value)
+            window_sum += value
+            points.append((period, value, window_sum / len(window)))
+        return points[-last:] if last else points
+
+    def year_over_year(self, period=None):
+        """Compare a month's mean total (default: the latest month) with the same month a year earlier."""
+        if not self.monthly:
+            return None
+        period = period or max(self.monthly)
+        previous = f"{int(period[:4]) - 1}{period[4:]}"
+        current = self.monthly[period].total / self.monthly[period].count
+        if previous not in self.monthly:
+            return {"period": period, "mean": current, "previous_mean": None, "change": None}
+        before = self.monthly[previous].total / self.monthly[previous].count
+        return {"period": period, "mean": current, "previous_mean": before,
+                "change": (current - before) / before if before else None}
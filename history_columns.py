@@ -0,0 +1,104 @@
+"""Compact in-memory history: one array('d') per column instead of a dict per entry.
+
+A dict entry ({"timestamp": ISO string, "total": float, "values": [6
+floats]}) costs several hundred bytes; here each entry is eight float64s
+(epoch seconds, total and the six category inputs), 64 bytes, stored
+contiguously so scans are fast. The columns can be viewed as NumPy arrays
+without copying, and entries are rebuilt as dicts on demand.
+"""
+import csv
+from array import array
+from datetime import datetime
+
+from footprint_engine import CATEGORY_KEYS, CATEGORY_LABELS, numpy_module
+
+
+class HistoryColumns:
+    def __init__(self):
+        self.timestamps = array("d")  # Seconds since the epoch (local time, as the ISO strings are)
+        self.totals = array("d")
+        self.columns = [array("d") for _ in CATEGORY_KEYS]
+
+    @classmethod
+    def from_entries(cls, entries):
+        history = cls()
+        for entry in entries:
+            history.append(entry)
+        return history
+
+    @classmethod
+    def from_store(cls, store):
+        return cls.from_entries(store.iter_entries())
+
+    def __len__(self):
+        return len(self.totals)
+
+    def __getitem__(self, i):
+        """The entry at `i` in the dict shape used by HistoryStore."""
+        return {"timestamp": self.timestamp(i), "total": self.totals[i], "values": [c[i] for c in self.columns]}
+
+    def __iter__(self):
+        return (self[i] for i in range(len(self)))
+
+    def append(self, entry):
+        row = [datetime.fromisoformat(entry["timestamp"]).timestamp(), entry["total"]] + list(entry["values"])
+        n = len(self)
+        try:
+            for column, value in zip([self.timestamps, self.totals] + self.columns, row):
+                column.append(value)
+        except BufferError:
+            # A NumPy view from to_numpy() is still alive; grow copies of the first n rows instead
+            self.timestamps, self.totals = array("d", self.timestamps[:n]), array("d", self.totals[:n])
+            self.columns = [array("d", c[:n]) for c in self.columns]
+            self.append(entry)
+
+    def timestamp(self, i):
+        return datetime.fromtimestamp(self.timestamps[i]).isoformat()
+
+    def date(self, i):
+        """Date of entry `i` as YYYY-MM-DD."""
+        return datetime.fromtimestamp(self.timestamps[i]).date().isoformat()
+
+    def column(self, category=None):
+        """The totals column, or the inputs of one category."""
+        return self.totals if category is None else self.columns[CATEGORY_KEYS.index(category)]
+
+    def moving_average(self, category=None, window=7):
+        """Mean of the last `window` entries (fewer at the start) at every position."""
+        values = self.column(category)
+        np = numpy_module()
+        if np is not None and len(values):
+            sums = np.cumsum(np.frombuffer(values, dtype=np.float64))
+            averages = sums / np.minimum(np.arange(1, len(values) + 1), window)
+            averages[window:] = (sums[window:] - sums[:-window]) / window
+            return averages.tolist()
+        averages, running = [], 0.0
+        for i, value in enumerate(values):
+            running += value - (values[i - window] if i >= window else 0.0)
+            averages.append(running / min(i + 1, window))
+        return averages
+
+    def to_numpy(self):
+        """{"timestamp", "total", <category>...} NumPy views sharing this container's memory (no copy).
+
+        Views taken before an append keep the rows they had.
+        """
+        np = numpy_module()
+        if np is None:
+            raise ImportError("NumPy is required for to_numpy()")
+        views = {"timestamp": np.frombuffer(self.timestamps, dtype=np.float64),
+                 "total": np.frombuffer(self.totals, dtype=np.float64)}
+        views.update((key, np.frombuffer(c, dtype=np.float64)) for key, c in zip(CATEGORY_KEYS, self.columns))
+        return views
+
+    def write_csv(self, filename):
+        with open(filename, "w", newline='') as f:
+            writer = csv.writer(f)
+            writer.writerow(["Timestamp"] + list(CATEGORY_LABELS) + ["Total"])
+            for i in range(len(self)):
+                writer.writerow([self.timestamp(i)] + [c[i] for c in self.columns] + [self.totals[i]])
+        return filename
+
+    def nbytes(self):
+        """Bytes used by the column data."""
+        return sum(c.itemsize * len(c) for c in [self.timestamps, self.totals] + self.columns)
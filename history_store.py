@@ -0,0 +1,220 @@
+import atexit
+import logging
+import os
+import re
+import sqlite3
+import threading
+import time
+import weakref
+
+from footprint_engine import CATEGORY_KEYS
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_HISTORY_PATH = "footprint_history.db"
+HISTORY_DIR = "history"  # One database per user in server mode
+
+_COLUMNS = ", ".join(CATEGORY_KEYS)
+_PLACEHOLDERS = ", ".join("?" for _ in CATEGORY_KEYS)
+_open_stores = weakref.WeakSet()  # Flushed at interpreter exit
+
+
+def user_history_path(user, directory=HISTORY_DIR):
+    safe = re.sub(r"[^A-Za-z0-9_.-]", "_", user) or "default"
+    return os.path.join(directory, f"{safe}.db")
+
+
+class HistoryStore:
+    """Persistent calculation history backed by SQLite.
+
+    Entries keep the same shape as the old in-memory list
+    ({"timestamp", "total", "values"}). Timestamps are indexed, so lookups
+    and range queries are O(log n) and opening the store does not read the
+    existing rows. Per-month counts and sums are kept in a summary table
+    that every flush updates, so monthly aggregates never rescan the
+    history. Appends are buffered and written in one transaction once
+    `batch_size` entries are pending or `flush_interval` seconds have passed
+    (a timer writes the end of a burst), and again at interpreter exit.
+    """
+
+    def __init__(self, path=DEFAULT_HISTORY_PATH, batch_size=50, flush_interval=2.0, cache_kib=None):
+        self.path = path
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self._pending = []
+        self._last_flush = time.monotonic()
+        self._timer = None
+        self._closed = False
+        self._lock = threading.RLock()
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        # Flet runs handlers on worker threads, so the connection is shared under a lock
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        if cache_kib is not None:
+            # Bound SQLite's page cache, e.g. to cap per-session memory in server mode
+            self._conn.execute(f"PRAGMA cache_size=-{int(cache_kib)}")
+        self._conn.execute(
+            f"CREATE TABLE IF NOT EXISTS history (id INTEGER PRIMARY KEY AUTOINCREMENT, "
+            f"timestamp TEXT NOT NULL, total REAL NOT NULL, {', '.join(k + ' REAL' for k in CATEGORY_KEYS)})"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS history_timestamp ON history (timestamp)")
+        self._conn.execute("BEGIN IMMEDIATE")  # Another process (e.g. a report worker) may be opening it too
+        has_summary = self._conn.execute(
+            "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'history_monthly'"
+        ).fetchone()
+        if not has_summary:
+            self._conn.execute(
+                f"CREATE TABLE history_monthly (month TEXT PRIMARY KEY, count INTEGER NOT NULL, total REAL NOT NULL, "
+                f"{', '.join(k + ' REAL NOT NULL' for k in CATEGORY_KEYS)})"
+            )
+            # Databases written by earlier versions: summarise the existing rows once
+            self._conn.execute(
+                f"INSERT INTO history_monthly SELECT substr(timestamp, 1, 7), COUNT(*), SUM(total), "
+                f"{', '.join(f'SUM({k})' for k in CATEGORY_KEYS)} FROM history GROUP BY 1"
+            )
+        self._conn.commit()
+        _open_stores.add(self)
+
+    def append(self, entry):
+        with self._lock:
+            self._pending.append((entry["timestamp"], entry["total"], *entry["values"]))
+            if len(self._pending) >= self.batch_size or time.monotonic() - self._last_flush >= self.flush_interval:
+                self.flush()
+            elif self._timer is None:
+                self._timer = threading.Timer(self.flush_interval, self._flush_later)
+                self._timer.daemon = True
+                self._timer.start()
+
+    def _flush_later(self):
+        try:
+            self.flush()
+        except Exception as e:
+            logger.error(f"Error writing history: {str(e)}")
+
+    def flush(self):
+        with self._lock:
+            self._last_flush = time.monotonic()
+            if self._timer is not None:
+                self._timer.cancel()
+                self._timer = None
+            if not self._pending or self._closed:
+                return
+            months = {}
+            for row in self._pending:
+                sums = months.setdefault(row[0][:7], [0] + [0.0] * (len(row) - 1))
+                sums[0] += 1
+                for i, value in enumerate(row[1:], 1):
+                    sums[i] += value
+            with self._conn:
+                self._conn.executemany(
+                    f"INSERT INTO history (timestamp, total, {_COLUMNS}) VALUES (?, ?, {_PLACEHOLDERS})", self._pending
+                )
+                self._conn.executemany(
+                    f"INSERT INTO history_monthly (month, count, total, {_COLUMNS}) VALUES (?, ?, ?, {_PLACEHOLDERS}) "
+                    f"ON CONFLICT (month) DO UPDATE SET count = count + excluded.count, total = total + excluded.total, "
+                    f"{', '.join(f'{k} = {k} + excluded.{k}' for k in CATEGORY_KEYS)}",
+                    [(month, *sums) for month, sums in months.items()]
+                )
+            logger.info(f"Wrote {len(self._pending)} history entries")
+            self._pending.clear()
+
+    def _query(self, sql, params=()):
+        with self._lock:
+            self.flush()
+            return [
+                {"timestamp": row[0], "total": row[1], "values": list(row[2:])}
+                for row in self._conn.execute(f"SELECT timestamp, total, {_COLUMNS} FROM history {sql}", params)
+            ]
+
+    def get(self, timestamp):
+        """Return the entry recorded at `timestamp`, or None."""
+        rows = self._query("WHERE timestamp = ? ORDER BY id DESC LIMIT 1", (timestamp,))
+        return rows[0] if rows else None
+
+    def range(self, start=None, end=None, limit=None):
+        """Return entries with start <= timestamp < end, oldest first."""
+        clauses, params = [], []
+        if start is not None:
+            clauses.append("timestamp >= ?")
+            params.append(start)
+        if end is not None:
+            clauses.append("timestamp < ?")
+            params.append(end)
+        sql = ("WHERE " + " AND ".join(clauses) if clauses else "") + " ORDER BY timestamp"
+        if limit is not None:
+            sql += " LIMIT ?"
+            params.append(limit)
+        return self._query(sql, params)
+
+    def latest(self, limit=50, before=None, prefix=None):
+        """Return the most recent entries, newest first.
+
+        `before` is a keyset cursor (only entries older than that timestamp)
+        for paging, and `prefix` restricts to timestamps starting with it,
+        e.g. "2024-05". Both are answered from the timestamp index.
+        """
+        clauses, params = [], []
+        if before is not None:
+            clauses.append("timestamp < ?")
+            params.append(before)
+        if prefix:
+            clauses.append("timestamp >= ? AND timestamp < ?")
+            params.extend([prefix, prefix + "\uffff"])
+        sql = ("WHERE " + " AND ".join(clauses) if clauses else "") + " ORDER BY timestamp DESC LIMIT ?"
+        return self._query(sql, params + [limit])
+
+    def iter_entries(self, batch_size=1000, prefix=None):
+        """Yield every entry, oldest first, reading `batch_size` rows at a time.
+
+        Pages are read from the timestamp index with a (timestamp, id) keyset,
+        so with `prefix` (e.g. "2024-05") only entries whose timestamp starts
+        with it are read.
+        """
+        last = (prefix or "", 0)
+        where, params = ("AND timestamp < ? ", [prefix + "\uffff"]) if prefix else ("", [])
+        while True:
+            with self._lock:
+                self.flush()
+                rows = self._conn.execute(
+                    f"SELECT id, timestamp, total, {_COLUMNS} FROM history WHERE (timestamp, id) > (?, ?) {where}"
+                    f"ORDER BY timestamp, id LIMIT ?",
+                    [*last] + params + [batch_size]
+                ).fetchall()
+            if not rows:
+                return
+            for row in rows:
+                yield {"timestamp": row[1], "total": row[2], "values": list(row[3:])}
+            last = (rows[-1][1], rows[-1][0])
+
+    def monthly_aggregates(self):
+        """Return (YYYY-MM, count, total sum, per-category sums) per month, read from the summary table."""
+        with self._lock:
+            self.flush()
+            rows = self._conn.execute(f"SELECT month, count, total, {_COLUMNS} FROM history_monthly ORDER BY month").fetchall()
+        return [(row[0], row[1], row[2], list(row[3:])) for row in rows]
+
+    def count(self):
+        with self._lock:
+            self.flush()
+            return self._conn.execute("SELECT COUNT(*) FROM history").fetchone()[0]
+
+    def close(self):
+        with self._lock:
+            if self._closed:
+                return
+            self.flush()
+            self._closed = True
+            self._conn.close()
+            _open_stores.discard(self)
+
+
+def _flush_open_stores():
+    for store in list(_open_stores):
+        try:
+            store.flush()
+        except Exception as e:
+            logger.error(f"Error writing history at exit: {str(e)}")
+
+
+atexit.register(_flush_open_stores)
@@ -0,0 +1,224 @@
+"""Timing histograms and counters for the calculator's hot paths.
+
+Disabled by default: SessionMetrics.timed() then returns the handler itself,
+so instrumented code pays nothing. Once enabled (before sessions start) every
+timed call is recorded both for its session and in the aggregate view, and
+every ERROR log record is counted against the session whose handler emitted it.
+Metrics are served in Prometheus text format (/metrics) and as JSON
+(/metrics.json), and can also be dumped to a JSON file periodically.
+"""
+import bisect
+import functools
+import json
+import logging
+import os
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+logger = logging.getLogger(__name__)
+
+BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)  # Seconds
+AGGREGATE = ""  # Session key of the all-sessions view
+_context = threading.local()  # Session of the handler running on this thread
+
+
+class Histogram:
+    __slots__ = ("counts", "sum", "count")
+
+    def __init__(self):
+        self.counts = [0] * (len(BUCKETS) + 1)  # Last slot is +Inf
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, seconds):
+        self.counts[bisect.bisect_left(BUCKETS, seconds)] += 1
+        self.sum += seconds
+        self.count += 1
+
+    def cumulative(self):
+        running, result = 0, []
+        for c in self.counts:
+            running += c
+            result.append(running)
+        return result
+
+    def as_dict(self):
+        return {"count": self.count, "sum": self.sum, "mean": self.sum / self.count if self.count else 0.0,
+                "buckets": dict(zip([str(b) for b in BUCKETS] + ["+Inf"], self.cumulative()))}
+
+
+class MetricsRegistry:
+    """Histograms and counters keyed by (name, session)."""
+
+    def __init__(self):
+        self.enabled = False
+        self._lock = threading.Lock()
+        self._histograms = {}
+        self._counters = {}
+        self._error_handler = None
+
+    def enable(self):
+        """Start recording; sessions set up after this call are instrumented."""
+        if not self.enabled:
+            self.enabled = True
+            self._error_handler = ErrorCounter(self)
+            logging.getLogger().addHandler(self._error_handler)
+
+    def observe(self, name, seconds, session=None):
+        with self._lock:
+            for key in ((name, session), (name, AGGREGATE)) if session else ((name, AGGREGATE),):
+                histogram = self._histograms.get(key)
+                if histogram is None:
+                    histogram = self._histograms[key] = Histogram()
+                histogram.observe(seconds)
+
+    def count(self, name, session=None, n=1):
+        with self._lock:
+            for key in ((name, session), (name, AGGREGATE)) if session else ((name, AGGREGATE),):
+                self._counters[key] = self._counters.get(key, 0) + n
+
+    def drop_session(self, session):
+        """Forget a finished session's own series; its samples stay in the aggregate."""
+        with self._lock:
+            for store in (self._histograms, self._counters):
+                for key in [k for k in store if k[1] == session]:
+                    del store[key]
+
+    def session(self, session_id):
+        return SessionMetrics(self, session_id)
+
+    def snapshot(self):
+        """Return {"aggregate": {...}, "sessions": {id: {...}}} with histograms and counters."""
+        result = {"aggregate": {"histograms": {}, "counters": {}}, "sessions": {}}
+        with self._lock:
+            for (name, session), histogram in self._histograms.items():
+                view = result["aggregate"] if session == AGGREGATE else result["sessions"].setdefault(session, {"histograms": {}, "counters": {}})
+                view["histograms"][name] = histogram.as_dict()
+            for (name, session), value in self._counters.items():
+                view = result["aggregate"] if session == AGGREGATE else result["sessions"].setdefault(session, {"histograms": {}, "counters": {}})
+                view["counters"][name] = value
+        return result
+
+    def prometheus(self):
+        """Render every series in the Prometheus text exposition format."""
+        lines = []
+        with self._lock:
+            histograms = sorted(self._histograms.items())
+            counters = sorted(self._counters.items())
+        for metric, per_session in (("carbon_handler_seconds", False), ("carbon_session_handler_seconds", True)):
+            lines.append(f"# TYPE {metric} histogram")
+            for (name, session), histogram in histograms:
+                if (session != AGGREGATE) != per_session:
+                    continue
+                labels = f'handler="{name}"' + (f',session="{session}"' if per_session else "")
+                for bound, value in zip([str(b) for b in BUCKETS] + ["+Inf"], histogram.cumulative()):
+                    lines.append(f'{metric}_bucket{{{labels},le="{bound}"}} {value}')
+                lines.append(f"{metric}_sum{{{labels}}} {histogram.sum}")
+                lines.append(f"{metric}_count{{{labels}}} {histogram.count}")
+        for name in sorted({name for (name, _), _ in counters}):
+            lines.append(f"# TYPE carbon_{name}_total counter")
+            for (counter, session), value in counters:
+                if counter == name:
+                    lines.append(f"carbon_{name}_total{{session=\"{session}\"}} {value}" if session else f"carbon_{name}_total {value}")
+        return "\n".join(lines) + "\n"
+
+    def serve(self, port, host="127.0.0.1"):
+        """Serve /metrics (Prometheus) and /metrics.json from a daemon thread."""
+        registry = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path == "/metrics":
+                    body, content_type = registry.prometheus().encode(), "text/plain; version=0.0.4"
+                elif self.path == "/metrics.json":
+                    body, content_type = json.dumps(registry.snapshot()).encode(), "application/json"
+                else:
+                    self.send_error(404)
+                    return
+                self.send_response(200)
+                self.send_header("Content-Type", content_type)
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass  # Scrapes would otherwise flood the application log
+
+        server = ThreadingHTTPServer((host, port), Handler)
+        threading.Thread(target=server.serve_forever, name="metrics-server", daemon=True).start()
+        logger.info(f"Serving metrics on http://{host}:{server.server_address[1]}/metrics")
+        return server
+
+    def dump_periodically(self, path, interval=60.0):
+        """Write snapshot() as JSON to `path` every `interval` seconds from a daemon thread."""
+        def run():
+            while True:
+                time.sleep(interval)
+                try:
+                    with open(path + ".tmp", "w") as f:
+                        json.dump({"timestamp": time.time(), **self.snapshot()}, f)
+                    os.replace(path + ".tmp", path)
+                except Exception as e:
+                    logger.warning(f"Metrics dump error: {str(e)}")  # Not an error record, so it is not counted
+
+        threading.Thread(target=run, name="metrics-dump", daemon=True).start()
+
+
+class ErrorCounter(logging.Handler):
+    """Counts ERROR log records against the session whose handler logged them."""
+
+    def __init__(self, registry):
+        super().__init__(logging.ERROR)
+        self.registry = registry
+
+    def emit(self, record):
+        self.registry.count("errors", getattr(_context, "session", None))
+
+
+class SessionMetrics:
+    """One session's view of the registry."""
+
+    def __init__(self, registry, session_id):
+        self.registry = registry
+        self.session = session_id
+
+    def timed(self, name):
+        """Decorator recording the call's duration under `name`; a no-op when metrics are disabled."""
+        if not self.registry.enabled:
+            return lambda fn: fn
+
+        def decorate(fn):
+            @functools.wraps(fn)
+            def wrapper(*args, **kwargs):
+                previous = getattr(_context, "session", None)
+                _context.session = self.session
+                start = time.perf_counter()
+                try:
+                    return fn(*args, **kwargs)
+                finally:
+                    self.registry.observe(name, time.perf_counter() - start, self.session)
+                    _context.session = previous
+            return wrapper
+        return decorate
+
+    def bind(self, fn):
+        """Attribute errors logged by `fn` (e.g. a callback run on a worker thread) to this session."""
+        if not self.registry.enabled:
+            return fn
+
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            previous = getattr(_context, "session", None)
+            _context.session = self.session
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                _context.session = previous
+        return wrapper
+
+    def close(self):
+        self.registry.drop_session(self.session)
+
+
+METRICS = MetricsRegistry()
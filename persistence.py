@@ -0,0 +1,149 @@
+"""Per-user saved form data, written atomically and coalesced in the background.
+
+Every user (a browser or desktop profile) gets its own file under the save
+directory. Saves are queued and written by one background thread after a
+short delay, so a burst of saves from the same user costs a single write;
+each write goes to a temporary file that is fsynced and then renamed over
+the old one, so a crash never leaves a truncated file. Files are JSON, or
+msgpack when that package is installed and selected.
+"""
+import atexit
+import importlib.util
+import json
+import logging
+import os
+import re
+import threading
+import time
+from concurrent.futures import Future
+
+from metrics import METRICS
+
+logger = logging.getLogger(__name__)
+
+LEGACY_FILE = "footprint_data.json"  # Single shared file written by earlier versions
+FORMATS = ("json", "msgpack")
+
+
+class SaveStore:
+    def __init__(self, directory="saved_data", fmt="json", delay=0.5):
+        self.directory = directory
+        self.delay = delay  # Seconds a save waits for newer saves from the same user
+        self.fmt = "json"
+        self.use_format(fmt)
+        self.writes = 0
+        self.coalesced = 0
+        self._pending = {}  # user -> [data, due time, futures]
+        self._cond = threading.Condition()
+        self._writer = None
+
+    def use_format(self, fmt):
+        if fmt not in FORMATS:
+            raise ValueError(f"Unknown save format: {fmt}")
+        if fmt == "msgpack" and importlib.util.find_spec("msgpack") is None:
+            logger.warning("msgpack is not installed; saving as JSON")
+            fmt = "json"
+        self.fmt = fmt
+
+    def path(self, user, fmt=None):
+        safe = re.sub(r"[^A-Za-z0-9_.-]", "_", user) or "default"
+        return os.path.join(self.directory, f"{safe}.{fmt or self.fmt}")
+
+    def save(self, user, data):
+        """Queue `data` as the user's saved state; the returned Future resolves to the file path once written."""
+        future = Future()
+        with self._cond:
+            entry = self._pending.get(user)
+            if entry is not None:
+                entry[0] = data  # Keep the first due time so a steady stream of saves still gets written
+                entry[2].append(future)
+                self.coalesced += 1
+            else:
+                self._pending[user] = [data, time.monotonic() + self.delay, [future]]
+            if self._writer is None:
+                self._writer = threading.Thread(target=self._run, name="save-writer", daemon=True)
+                self._writer.start()
+            self._cond.notify()
+        return future
+
+    def load(self, user, legacy=False):
+        """Return the user's saved data, including a save that has not been written yet.
+
+        With `legacy` (single-user desktop mode only: the file is shared) this
+        falls back to the legacy file; raises FileNotFoundError when nothing
+        was saved.
+        """
+        with self._cond:
+            if user in self._pending:
+                return dict(self._pending[user][0])
+        for fmt in sorted(FORMATS, key=lambda f: f != self.fmt):
+            path = self.path(user, fmt)
+            if os.path.exists(path):
+                with open(path, "rb") as f:
+                    return self._decode(f.read(), fmt)
+        if not legacy:
+            raise FileNotFoundError(f"No saved data for {user}")
+        with open(LEGACY_FILE, "rb") as f:
+            return json.loads(f.read())
+
+    def flush(self):
+        """Write every queued save now (e.g. at shutdown)."""
+        with self._cond:
+            pending, self._pending = self._pending, {}
+        for user, (data, _, futures) in pending.items():
+            self._complete(user, data, futures)
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while not self._pending:
+                    self._cond.wait()
+                user, (data, due, futures) = min(self._pending.items(), key=lambda item: item[1][1])
+                wait = due - time.monotonic()
+                if wait > 0:
+                    self._cond.wait(wait)
+                    continue
+                del self._pending[user]
+            self._complete(user, data, futures)
+
+    def _complete(self, user, data, futures):
+        start = time.perf_counter()
+        try:
+            path = self._write(user, data)
+        except Exception as e:
+            for future in futures:
+                future.set_exception(e)
+            return
+        finally:
+            if METRICS.enabled:
+                METRICS.observe("save_write", time.perf_counter() - start)  # The file I/O itself, for all users
+        for future in futures:
+            future.set_result(path)
+
+    def _write(self, user, data):
+        os.makedirs(self.directory, exist_ok=True)
+        path = self.path(user)
+        tmp = f"{path}.{threading.get_ident()}.tmp"  # flush() may write while the background writer does
+        with open(tmp, "wb") as f:
+            f.write(self._encode(data))
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, path)
+        self.writes += 1
+        return path
+
+    def _encode(self, data):
+        if self.fmt == "msgpack":
+            import msgpack
+            return msgpack.packb(data, use_bin_type=True)
+        return json.dumps(data, indent=2).encode()
+
+    def _decode(self, raw, fmt):
+        if fmt == "msgpack":
+            import msgpack
+            return msgpack.unpackb(raw, raw=False)
+        return json.loads(raw)
+
+
+SAVE_STORE = SaveStore()
+atexit.register(SAVE_STORE.flush)
@@ -0,0 +1,70 @@
+import logging
+import threading
+
+logger = logging.getLogger(__name__)
+
+FRAME_INTERVAL = 1 / 60  # Seconds between coalesced updates
+
+
+class UpdateScheduler:
+    """Coalesce control updates into at most one page.update() per frame.
+
+    Handlers call mark(*controls) instead of page.update(); controls marked
+    within the same frame are sent together in a single update message.
+    mark() with no controls schedules a full page update (needed for
+    page-level properties such as snack_bar or dialog). Safe to call from
+    Flet's handler threads; flushing always happens on the page's event loop.
+    """
+
+    def __init__(self, page, interval=FRAME_INTERVAL):
+        self.page = page
+        self.interval = interval
+        self._dirty = {}
+        self._full = False
+        self._scheduled = False
+        self._timers = {}
+        self._lock = threading.Lock()
+
+    def mark(self, *controls):
+        with self._lock:
+            if controls:
+                for control in controls:
+                    self._dirty[id(control)] = control
+            else:
+                self._full = True
+            if self._scheduled:
+                return
+            self._scheduled = True
+        self.page.loop.call_soon_threadsafe(self._arm)
+
+    def _arm(self):
+        self.page.loop.call_later(self.interval, self.flush)
+
+    def flush(self):
+        with self._lock:
+            controls = list(self._dirty.values())
+            full = self._full
+            self._dirty.clear()
+            self._full = False
+            self._scheduled = False
+        try:
+            if full:
+                self.page.update()
+            elif controls:
+                self.page.update(*controls)
+        except Exception as e:
+            logger.error(f"UI update error: {str(e)}")
+
+    def debounce(self, key, delay, callback):
+        """Run callback on the event loop once no new call for `key` arrived for `delay` seconds."""
+        def arm():
+            timer = self._timers.pop(key, None)
+            if timer is not None:
+                timer.cancel()
+            self._timers[key] = self.page.loop.call_later(delay, fire)
+
+        def fire():
+            self._timers.pop(key, None)
+            callback()
+
+        self.page.loop.call_soon_threadsafe(arm)